@@ -0,0 +1,164 @@
+"""Resúmenes de registros_pp mantenidos de forma incremental.
+
+Cada inserción, actualización o borrado hecho a través de backend.database ajusta
+en O(1) contadores, sumas y sumas de cuadrados guardados en un SQLite local, de
+modo que el panel no necesita recorrer la tabla. Si el resumen se desincroniza
+(p. ej. por escrituras hechas desde otra máquina), se reconstruye con:
+
+    python -m backend.agregados --reconstruir
+"""
+import argparse
+import math
+import os
+import sqlite3
+import threading
+
+import pandas as pd
+
+from backend.cache import CACHE_DIR
+
+NUTRIENTES = ["pH", "nitrogeno", "fosforo", "potasio"]
+
+
+def _valido(valor):
+    return valor is not None and not (isinstance(valor, float) and math.isnan(valor))
+
+
+def contribuciones(fila):
+    """(grupo, clave, variable, valor) que aporta una fila a los resúmenes."""
+    aportes = []
+    if _valido(fila.get("tipo_suelo")) and _valido(fila.get("fertilidad")):
+        aportes.append(("suelo", str(fila["tipo_suelo"]), "fertilidad", float(fila["fertilidad"])))
+    if _valido(fila.get("mes")) and _valido(fila.get("cultivo")):
+        aportes.append(("mes_cultivo", f"{int(fila['mes'])}|{fila['cultivo']}", "registros", 1.0))
+    if _valido(fila.get("cultivo")):
+        for variable in NUTRIENTES:
+            if _valido(fila.get(variable)):
+                aportes.append(("cultivo", str(fila["cultivo"]), variable, float(fila[variable])))
+    return aportes
+
+
+class Agregados:
+    """Tabla (grupo, clave, variable) -> n, suma, suma de cuadrados."""
+
+    def __init__(self, ruta=None):
+        self.ruta = ruta or os.path.join(CACHE_DIR, "agregados.sqlite")
+        self._conn = None
+        self._lock = threading.Lock()
+
+    def _conexion(self):
+        if self._conn is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.ruta)), exist_ok=True)
+            conn = sqlite3.connect(self.ruta, check_same_thread=False)
+            conn.executescript(
+                "PRAGMA journal_mode=WAL;"
+                "CREATE TABLE IF NOT EXISTS agregados ("
+                " grupo TEXT NOT NULL, clave TEXT NOT NULL, variable TEXT NOT NULL,"
+                " n REAL NOT NULL, suma REAL NOT NULL, suma_cuadrados REAL NOT NULL,"
+                " PRIMARY KEY (grupo, clave, variable));"
+            )
+            self._conn = conn
+        return self._conn
+
+    def _aplicar(self, filas, signo):
+        parametros = [
+            (grupo, clave, variable, signo, signo * valor, signo * valor * valor)
+            for fila in filas for grupo, clave, variable, valor in contribuciones(fila)
+        ]
+        if not parametros:
+            return
+        with self._lock:
+            conn = self._conexion()
+            with conn:
+                conn.executemany(
+                    "INSERT INTO agregados (grupo, clave, variable, n, suma, suma_cuadrados)"
+                    " VALUES (?, ?, ?, ?, ?, ?)"
+                    " ON CONFLICT (grupo, clave, variable) DO UPDATE SET"
+                    " n = n + excluded.n, suma = suma + excluded.suma,"
+                    " suma_cuadrados = suma_cuadrados + excluded.suma_cuadrados",
+                    parametros,
+                )
+                conn.execute("DELETE FROM agregados WHERE n <= 0")
+
+    def registrar_inserciones(self, filas):
+        self._aplicar(filas, 1.0)
+
+    def registrar_eliminaciones(self, filas):
+        self._aplicar(filas, -1.0)
+
+    def registrar_actualizaciones(self, anteriores, nuevas):
+        self._aplicar(anteriores, -1.0)
+        self._aplicar(nuevas, 1.0)
+
+    def reconstruir(self, paginas):
+        """Recalcula todo desde cero a partir de un iterable de DataFrames de registros."""
+        with self._lock:
+            conn = self._conexion()
+            with conn:
+                conn.execute("DELETE FROM agregados")
+        total = 0
+        for pagina in paginas:
+            filas = pagina.to_dict("records")
+            self.registrar_inserciones(filas)
+            total += len(filas)
+        return total
+
+    def _grupo(self, grupo):
+        with self._lock:
+            filas = self._conexion().execute(
+                "SELECT clave, variable, n, suma, suma_cuadrados FROM agregados WHERE grupo = ?", (grupo,)
+            ).fetchall()
+        return pd.DataFrame(filas, columns=["clave", "variable", "n", "suma", "suma_cuadrados"])
+
+    def fertilidad_por_suelo(self):
+        df = self._grupo("suelo")
+        return pd.DataFrame({
+            "tipo_suelo": df["clave"],
+            "registros": df["n"].astype(int),
+            "tasa_fertilidad": df["suma"] / df["n"],
+        }).sort_values("tipo_suelo").reset_index(drop=True)
+
+    def cultivos_por_mes(self):
+        df = self._grupo("mes_cultivo")
+        if df.empty:
+            return pd.DataFrame()
+        partes = df["clave"].str.split("|", n=1, expand=True)
+        tabla = pd.DataFrame({"mes": partes[0].astype(int), "cultivo": partes[1], "registros": df["n"].astype(int)})
+        return tabla.pivot_table(index="mes", columns="cultivo", values="registros", aggfunc="sum", fill_value=0).astype(int)
+
+    def nutrientes_por_cultivo(self):
+        df = self._grupo("cultivo")
+        if df.empty:
+            return pd.DataFrame()
+        media = df["suma"] / df["n"]
+        varianza = (df["suma_cuadrados"] / df["n"] - media ** 2).clip(lower=0)
+        tabla = pd.DataFrame({"cultivo": df["clave"], "variable": df["variable"],
+                              "media": media, "desviacion": varianza ** 0.5})
+        return tabla.pivot_table(index="cultivo", columns="variable", values=["media", "desviacion"])
+
+
+_agregados = None
+
+
+def obtener_agregados():
+    global _agregados
+    if _agregados is None:
+        _agregados = Agregados()
+    return _agregados
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Resúmenes incrementales de registros_pp.")
+    parser.add_argument("--reconstruir", action="store_true", help="Recalcular desde todos los registros")
+    args = parser.parse_args(argv)
+
+    agregados = obtener_agregados()
+    if args.reconstruir:
+        from backend.database import iterar_paginas
+
+        print(f"{agregados.reconstruir(iterar_paginas(2000))} registros procesados")
+    print(agregados.fertilidad_por_suelo().to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
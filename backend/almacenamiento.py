@@ -0,0 +1,348 @@
+"""Backends de almacenamiento para la tabla registros_pp.
+
+`obtener_almacenamiento()` devuelve el backend activo, elegido con la variable
+PREDICC_ALMACENAMIENTO ("supabase" por defecto o "sqlite"). Ningún backend abre
+conexiones al importarse: el cliente se crea en el primer uso y se reutiliza.
+
+En Supabase, la columna `clave_idempotencia` y su restricción UNIQUE se crean con
+supabase/migrations/20261018000000_registros_pp_clave_idempotencia.sql.
+"""
+import logging
+import os
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+
+from backend.cache import CACHE_DIR
+
+TABLA = "registros_pp"
+
+logger = logging.getLogger("predicc.almacenamiento")
+
+# Errores de PostgREST/Postgres cuando falta la columna (42703, PGRST204) o su restricción UNIQUE (42P10)
+CODIGOS_SIN_COLUMNA = {"42703", "PGRST204"}
+CODIGO_SIN_RESTRICCION = "42P10"
+
+
+class FaltaMigracion(RuntimeError):
+    """registros_pp no tiene la columna o la restricción UNIQUE que exige la inserción idempotente.
+
+    No es un problema de la fila: las filas deben esperar en el spool hasta aplicar la migración.
+    """
+
+# Columnas de registros_pp (sin id) y su tipo en SQLite
+ESQUEMA = {
+    "fecha_ingreso": "TEXT",
+    "fecha": "TEXT",
+    "prediccion": "INTEGER",
+    "tipo_suelo": "TEXT",
+    "pH": "REAL",
+    "materia_organica": "REAL",
+    "conductividad": "REAL",
+    "nitrogeno": "REAL",
+    "fosforo": "REAL",
+    "potasio": "REAL",
+    "humedad": "REAL",
+    "densidad": "REAL",
+    "altitud": "REAL",
+    "temperatura": "REAL",
+    "condiciones_clima": "TEXT",
+    "mes": "INTEGER",
+    "evapotranspiracion": "REAL",
+    "fertilidad": "INTEGER",
+    "cultivo": "TEXT",
+    "lugar": "TEXT",
+    "latitud": "REAL",
+    "longitud": "REAL",
+    "clave_idempotencia": "TEXT",
+}
+
+
+class Almacenamiento(ABC):
+    """Operaciones sobre registros_pp que necesita la aplicación."""
+
+    # Filas máximas que el backend devuelve por consulta (None: sin tope)
+    max_filas = None
+
+    @abstractmethod
+    def insertar(self, fila):
+        """Inserta una fila y devuelve la lista de filas insertadas."""
+
+    @abstractmethod
+    def insertar_lote(self, filas, tam_lote=500):
+        """Inserta filas con inserciones multi-fila; devuelve cuántas insertó."""
+
+    @abstractmethod
+    def insertar_lote_idempotente(self, filas, columna="clave_idempotencia"):
+        """Inserta ignorando filas cuyo valor en `columna` ya exista.
+
+        Devuelve solo las filas realmente insertadas, con su id.
+        """
+
+    @abstractmethod
+    def seleccionar(self, columnas=None, despues_de_id=None, limite=None, orden="id", desc=False,
+                    desde=None, hasta=None, cultivo=None, fertilidad=None):
+        """Devuelve una lista de dicts filtrada en el backend."""
+
+    @abstractmethod
+    def seleccionar_ids(self, ids):
+        """Filas completas de los `ids` indicados."""
+
+    @abstractmethod
+    def actualizar(self, id_registro, datos):
+        """Actualiza un registro y devuelve la lista de filas actualizadas."""
+
+    @abstractmethod
+    def actualizar_ids(self, ids, datos):
+        """Aplica los mismos `datos` a todos los `ids`; devuelve las filas actualizadas."""
+
+    @abstractmethod
+    def eliminar(self, id_registro):
+        """Elimina un registro por su id; devuelve las filas eliminadas (vacía si no había)."""
+
+
+class AlmacenamientoSupabase(Almacenamiento):
+    """registros_pp en Supabase; el cliente se crea en la primera operación."""
+
+    def __init__(self, url=None, key=None):
+        self._url = url
+        self._key = key
+        self._cliente = None
+        self._lock = threading.Lock()
+        # PostgREST recorta cada respuesta a su "max rows" (1000 por defecto en Supabase)
+        self.max_filas = int(os.environ.get("PREDICC_SUPABASE_MAX_FILAS", 1000))
+
+    @property
+    def cliente(self):
+        if self._cliente is None:
+            with self._lock:
+                if self._cliente is None:
+                    from supabase import create_client
+
+                    # Variables de entorno (scripts sin Streamlit) o st.secrets
+                    url = self._url or os.environ.get("SUPABASE_URL")
+                    key = self._key or os.environ.get("SUPABASE_ANON_KEY")
+                    if not url or not key:
+                        import streamlit as st
+
+                        url = url or st.secrets["supabase"]["url"]
+                        key = key or st.secrets["supabase"]["anon_key"]
+                    self._cliente = create_client(url, key)
+        return self._cliente
+
+    def _tabla(self):
+        return self.cliente.table(TABLA)
+
+    def insertar(self, fila):
+        return self._tabla().insert(fila).execute().data
+
+    def insertar_lote(self, filas, tam_lote=500):
+        insertadas = 0
+        for inicio in range(0, len(filas), tam_lote):
+            lote = filas[inicio:inicio + tam_lote]
+            self._tabla().insert(lote).execute()
+            insertadas += len(lote)
+        return insertadas
+
+    def insertar_lote_idempotente(self, filas, columna="clave_idempotencia"):
+        # Requiere una restricción UNIQUE sobre `columna` en registros_pp (ver la migración).
+        # Sin ella no se degrada a un insert simple: los reintentos duplicarían filas.
+        try:
+            return self._tabla().upsert(filas, on_conflict=columna, ignore_duplicates=True).execute().data
+        except Exception as e:
+            codigo = getattr(e, "code", None)
+            if codigo == CODIGO_SIN_RESTRICCION or (codigo in CODIGOS_SIN_COLUMNA and columna in str(e)):
+                logger.error("registros_pp no tiene '%s' con restricción UNIQUE; aplica la migración: %s", columna, e)
+                raise FaltaMigracion(f"Falta la migración de '{columna}' en {TABLA}: {e}") from e
+            raise
+
+    def seleccionar(self, columnas=None, despues_de_id=None, limite=None, orden="id", desc=False,
+                    desde=None, hasta=None, cultivo=None, fertilidad=None):
+        query = self._tabla().select(",".join(columnas) if columnas else "*")
+        if despues_de_id is not None:
+            query = query.gt("id", int(despues_de_id))
+        if desde is not None:
+            query = query.gte("fecha_ingreso", str(desde))
+        if hasta is not None:
+            query = query.lte("fecha_ingreso", str(hasta))
+        if cultivo is not None:
+            query = query.eq("cultivo", cultivo)
+        if fertilidad is not None:
+            query = query.eq("fertilidad", int(fertilidad))
+        query = query.order(orden, desc=desc)
+        if limite is not None:
+            query = query.limit(limite)
+        return query.execute().data
+
+    def seleccionar_ids(self, ids):
+        return self._tabla().select("*").in_("id", [int(i) for i in ids]).execute().data
+
+    def actualizar(self, id_registro, datos):
+        return self._tabla().update(datos).eq("id", int(id_registro)).execute().data
+
+    # Con RLS, un update o delete que la política no permite no falla: devuelve []
+    def actualizar_ids(self, ids, datos):
+        return self._tabla().update(datos).in_("id", [int(i) for i in ids]).execute().data
+
+    def eliminar(self, id_registro):
+        return self._tabla().delete().eq("id", int(id_registro)).execute().data
+
+
+class AlmacenamientoSQLite(Almacenamiento):
+    """registros_pp en un archivo SQLite local, para pruebas de carga y uso sin red."""
+
+    def __init__(self, ruta=None):
+        self.ruta = ruta or os.environ.get("PREDICC_SQLITE_PATH", os.path.join(CACHE_DIR, "registros_pp.sqlite"))
+        self._conn = None
+        self._lock = threading.Lock()
+
+    def _conexion(self):
+        if self._conn is None:
+            if self.ruta != ":memory:":
+                os.makedirs(os.path.dirname(os.path.abspath(self.ruta)), exist_ok=True)
+            conn = sqlite3.connect(self.ruta, check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            columnas = ", ".join(f'"{c}" {t}' for c, t in ESQUEMA.items())
+            conn.executescript(
+                f"PRAGMA journal_mode=WAL;"
+                f"CREATE TABLE IF NOT EXISTS {TABLA} (id INTEGER PRIMARY KEY AUTOINCREMENT, {columnas});"
+                f"CREATE INDEX IF NOT EXISTS idx_{TABLA}_fecha_ingreso ON {TABLA} (fecha_ingreso);"
+                f"CREATE INDEX IF NOT EXISTS idx_{TABLA}_cultivo ON {TABLA} (cultivo);"
+            )
+            # Bases creadas con un esquema anterior: añadir las columnas nuevas
+            existentes = {fila[1] for fila in conn.execute(f"PRAGMA table_info({TABLA})")}
+            for col, tipo in ESQUEMA.items():
+                if col not in existentes:
+                    conn.execute(f'ALTER TABLE {TABLA} ADD COLUMN "{col}" {tipo}')
+            conn.execute(f"CREATE UNIQUE INDEX IF NOT EXISTS idx_{TABLA}_clave_idempotencia "
+                         f"ON {TABLA} (clave_idempotencia)")
+            conn.commit()
+            self._conn = conn
+        return self._conn
+
+    @staticmethod
+    def _valores(datos):
+        # sqlite3 no acepta escalares de NumPy
+        return [v.item() if hasattr(v, "item") else v for v in datos.values()]
+
+    @staticmethod
+    def _validar(columnas):
+        desconocidas = [c for c in columnas if c != "id" and c not in ESQUEMA]
+        if desconocidas:
+            raise ValueError(f"Columnas desconocidas en {TABLA}: {desconocidas}")
+
+    def _insertar(self, conn, filas, verbo="INSERT"):
+        ids = []
+        for fila in filas:
+            self._validar(fila)
+            cols = ", ".join(f'"{c}"' for c in fila)
+            marcas = ", ".join("?" for _ in fila)
+            cur = conn.execute(f"{verbo} INTO {TABLA} ({cols}) VALUES ({marcas})", self._valores(fila))
+            if cur.rowcount:
+                ids.append(cur.lastrowid)
+        return ids
+
+    def _por_ids(self, conn, ids):
+        marcas = ", ".join("?" for _ in ids)
+        return [dict(f) for f in conn.execute(f"SELECT * FROM {TABLA} WHERE id IN ({marcas}) ORDER BY id", ids)]
+
+    def insertar(self, fila):
+        with self._lock:
+            conn = self._conexion()
+            with conn:
+                ids = self._insertar(conn, [fila])
+            return self._por_ids(conn, ids)
+
+    def insertar_lote(self, filas, tam_lote=500):
+        insertadas = 0
+        with self._lock:
+            conn = self._conexion()
+            for inicio in range(0, len(filas), tam_lote):
+                with conn:
+                    insertadas += len(self._insertar(conn, filas[inicio:inicio + tam_lote]))
+        return insertadas
+
+    def insertar_lote_idempotente(self, filas, columna="clave_idempotencia"):
+        if columna != "clave_idempotencia":
+            raise ValueError("El backend SQLite solo garantiza unicidad en clave_idempotencia")
+        with self._lock:
+            conn = self._conexion()
+            with conn:
+                ids = self._insertar(conn, filas, verbo="INSERT OR IGNORE")
+            return self._por_ids(conn, ids)
+
+    def seleccionar(self, columnas=None, despues_de_id=None, limite=None, orden="id", desc=False,
+                    desde=None, hasta=None, cultivo=None, fertilidad=None):
+        if columnas:
+            self._validar(columnas)
+        self._validar([orden])
+        condiciones, params = [], []
+        for sql, valor in (("id > ?", despues_de_id), ("fecha_ingreso >= ?", desde),
+                           ("fecha_ingreso <= ?", hasta), ("cultivo = ?", cultivo),
+                           ("fertilidad = ?", fertilidad)):
+            if valor is not None:
+                condiciones.append(sql)
+                params.append(valor if isinstance(valor, (int, float)) else str(valor))
+        seleccion = ", ".join(f'"{c}"' for c in columnas) if columnas else "*"
+        consulta = f"SELECT {seleccion} FROM {TABLA}"
+        if condiciones:
+            consulta += " WHERE " + " AND ".join(condiciones)
+        consulta += f' ORDER BY "{orden}" {"DESC" if desc else "ASC"}'
+        if limite is not None:
+            consulta += " LIMIT ?"
+            params.append(int(limite))
+        with self._lock:
+            return [dict(f) for f in self._conexion().execute(consulta, params)]
+
+    def seleccionar_ids(self, ids):
+        with self._lock:
+            return self._por_ids(self._conexion(), [int(i) for i in ids])
+
+    def actualizar(self, id_registro, datos):
+        self._validar(datos)
+        asignaciones = ", ".join(f'"{c}" = ?' for c in datos)
+        with self._lock:
+            conn = self._conexion()
+            with conn:
+                cur = conn.execute(f"UPDATE {TABLA} SET {asignaciones} WHERE id = ?",
+                                   [*self._valores(datos), int(id_registro)])
+            return self._por_ids(conn, [int(id_registro)]) if cur.rowcount else []
+
+    def actualizar_ids(self, ids, datos):
+        self._validar(datos)
+        asignaciones = ", ".join(f'"{c}" = ?' for c in datos)
+        marcas = ", ".join("?" for _ in ids)
+        with self._lock:
+            conn = self._conexion()
+            with conn:
+                conn.execute(f"UPDATE {TABLA} SET {asignaciones} WHERE id IN ({marcas})",
+                             [*self._valores(datos), *(int(i) for i in ids)])
+            return self._por_ids(conn, [int(i) for i in ids])
+
+    def eliminar(self, id_registro):
+        with self._lock:
+            conn = self._conexion()
+            with conn:
+                filas = self._por_ids(conn, [int(id_registro)])
+                conn.execute(f"DELETE FROM {TABLA} WHERE id = ?", (int(id_registro),))
+            return filas
+
+
+BACKENDS = {"supabase": AlmacenamientoSupabase, "sqlite": AlmacenamientoSQLite}
+
+_almacenamiento = None
+
+
+def obtener_almacenamiento():
+    """Backend activo; se construye una sola vez por proceso."""
+    global _almacenamiento
+    if _almacenamiento is None:
+        _almacenamiento = BACKENDS[os.environ.get("PREDICC_ALMACENAMIENTO", "supabase")]()
+    return _almacenamiento
+
+
+def configurar_almacenamiento(almacenamiento):
+    """Sustituye el backend activo (p. ej. un AlmacenamientoSQLite para benchmarks)."""
+    global _almacenamiento
+    _almacenamiento = almacenamiento
+    return almacenamiento
@@ -1,29 +1,196 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from backend.cache import CacheTTL
+from backend.espacial import indice_si_existe
+from backend.metricas import medido
+
+ELEVATION_URL = os.environ.get("PREDICC_ELEVATION_URL", "https://api.open-elevation.com/api/v1/lookup")
+WEATHER_URL = os.environ.get("PREDICC_WEATHER_URL", "https://api.openweathermap.org/data/2.5/weather")
+
+TIMEOUT = (3.05, 10)  # (conexión, lectura) en segundos
+
+# La altitud no cambia: se guarda sin caducidad y con ~11 m de resolución.
+# El clima vale unos 30 minutos y se agrupa en celdas de ~1 km.
+DECIMALES_ELEVACION = 4
+DECIMALES_CLIMA = 2
+cache_elevacion = CacheTTL("elevacion", ttl=None)
+cache_clima = CacheTTL("clima", ttl=30 * 60)
+
+# Antes de consultar la API se reutiliza la altitud de una muestra ya guardada a
+# menos de este radio, si el índice espacial está construido en el proceso. Esa
+# altitud no se guarda en cache_elevacion: la caché es permanente y solo debe
+# contener valores de la API.
+RADIO_ALTITUD_KM = 0.2
+
+
+def _crear_sesion():
+    reintentos = Retry(
+        total=3,
+        backoff_factor=0.5,
+        status_forcelist=(429, 500, 502, 503, 504),
+        allowed_methods=frozenset(["GET", "POST"]),
+    )
+    adaptador = HTTPAdapter(pool_connections=4, pool_maxsize=16, max_retries=reintentos)
+    sesion = requests.Session()
+    sesion.mount("http://", adaptador)
+    sesion.mount("https://", adaptador)
+    return sesion
+
 
+session = _crear_sesion()
+
+
+def _clave(lat, lon, decimales):
+    return f"{round(float(lat), decimales):.{decimales}f},{round(float(lon), decimales):.{decimales}f}"
+
+
+def _altitud_muestreada(lat, lon):
+    indice = indice_si_existe()
+    if indice is None:
+        return None
+    return indice.altitud_cercana(float(lat), float(lon), RADIO_ALTITUD_KM)
+
+
+@medido("get_elevation")
 def get_elevation(lat, lon):
+    clave = _clave(lat, lon, DECIMALES_ELEVACION)
+    altitud = cache_elevacion.get(clave)
+    if altitud is not None:
+        return altitud
+    altitud = _altitud_muestreada(lat, lon)
+    if altitud is not None:
+        return altitud
     try:
-        url = f"https://api.open-elevation.com/api/v1/lookup?locations={lat},{lon}"
-        response = requests.get(url)
-        return float(response.json()['results'][0]['elevation'])
-    except:
+        response = session.get(f"{ELEVATION_URL}?locations={lat},{lon}", timeout=TIMEOUT)
+        altitud = float(response.json()['results'][0]['elevation'])
+    except Exception:
         return None
+    cache_elevacion.set(clave, altitud)
+    return altitud
+
 
+@medido("get_weather")
 def get_weather(lat, lon, api_key):
+    clave = _clave(lat, lon, DECIMALES_CLIMA)
+    clima = cache_clima.get(clave)
+    if clima is not None:
+        return clima
     try:
-        url = "https://api.openweathermap.org/data/2.5/weather"
         params = {"lat": lat, "lon": lon, "appid": api_key, "units": "metric"}
-        data = requests.get(url, params=params).json()
+        data = session.get(WEATHER_URL, params=params, timeout=TIMEOUT).json()
 
-        return {
+        clima = {
             "humedad": data["main"]["humidity"],
             "temperatura": data["main"]["temp"],
             "ubicacion": data.get("name", "")
         }
 
-    except:
+    except Exception:
         return {
             "humedad": None,
             "temperatura": None,
             "ubicacion": ""
         }
+    cache_clima.set(clave, clima)
+    return clima
+
+
+class _LimitadorTasa:
+    """Espacia las llamadas para no superar `por_segundo` peticiones por segundo."""
+
+    def __init__(self, por_segundo):
+        self.intervalo = 1.0 / por_segundo if por_segundo else 0.0
+        self._siguiente = 0.0
+        self._lock = threading.Lock()
+
+    def esperar(self):
+        with self._lock:
+            ahora = time.monotonic()
+            turno = max(self._siguiente, ahora)
+            self._siguiente = turno + self.intervalo
+        if turno > ahora:
+            time.sleep(turno - ahora)
+
+
+def get_elevations(coords, tam_lote=100):
+    """Altitud para muchas coordenadas, agrupando las consultas en lotes de `tam_lote`.
+
+    Devuelve una lista alineada con `coords`; los puntos que fallan quedan en None.
+    """
+    claves = [_clave(lat, lon, DECIMALES_ELEVACION) for lat, lon in coords]
+    resultado = [cache_elevacion.get(clave) for clave in claves]
+
+    pendientes = {}
+    for i, clave in enumerate(claves):
+        if resultado[i] is None:
+            resultado[i] = _altitud_muestreada(*coords[i])
+        if resultado[i] is None:
+            pendientes.setdefault(clave, []).append(i)
+
+    unicos = list(pendientes)
+    for inicio in range(0, len(unicos), tam_lote):
+        lote = unicos[inicio:inicio + tam_lote]
+        locations = [{"latitude": float(coords[pendientes[c][0]][0]),
+                      "longitude": float(coords[pendientes[c][0]][1])} for c in lote]
+        try:
+            response = session.post(ELEVATION_URL, json={"locations": locations}, timeout=TIMEOUT)
+            resultados = response.json()["results"]
+        except Exception:
+            continue
+        for clave, res in zip(lote, resultados):
+            try:
+                altitud = float(res["elevation"])
+            except (KeyError, TypeError, ValueError):
+                continue
+            cache_elevacion.set(clave, altitud)
+            for i in pendientes[clave]:
+                resultado[i] = altitud
+    return resultado
+
+
+def enriquecer_coordenadas(coords, api_key, tam_lote=100, max_hilos=8, max_por_segundo=10):
+    """Obtiene altitud, humedad, temperatura y ubicación para una lista de coordenadas.
+
+    La altitud se pide en lotes multi-punto y el clima en paralelo con un pool de
+    hilos limitado a `max_por_segundo` peticiones. Devuelve un DataFrame alineado
+    con la entrada; los puntos que fallan conservan None en las columnas afectadas.
+    """
+    coords = np.asarray(coords, dtype=float).reshape(-1, 2)
+    altitudes = get_elevations(coords, tam_lote=tam_lote)
+
+    # Un único pedido de clima por celda cuantizada
+    celdas = {}
+    for lat, lon in coords:
+        celdas.setdefault(_clave(lat, lon, DECIMALES_CLIMA), (lat, lon))
+
+    limitador = _LimitadorTasa(max_por_segundo)
+
+    def _clima(punto):
+        if cache_clima.get(_clave(*punto, DECIMALES_CLIMA)) is None:
+            limitador.esperar()
+        return get_weather(punto[0], punto[1], api_key)
+
+    with ThreadPoolExecutor(max_workers=max_hilos) as pool:
+        climas = dict(zip(celdas, pool.map(_clima, celdas.values())))
 
+    filas = []
+    for (lat, lon), altitud in zip(coords, altitudes):
+        clima = climas[_clave(lat, lon, DECIMALES_CLIMA)]
+        filas.append({
+            "latitud": lat,
+            "longitud": lon,
+            "altitud": altitud,
+            "humedad": clima["humedad"],
+            "temperatura": clima["temperatura"],
+            "ubicacion": clima["ubicacion"],
+        })
+    return pd.DataFrame(filas, columns=["latitud", "longitud", "altitud", "humedad", "temperatura", "ubicacion"])
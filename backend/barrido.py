@@ -0,0 +1,82 @@
+"""Barrido de calendario de siembra: una muestra de suelo en una rejilla de condiciones.
+
+La muestra se repite para los 12 meses y, opcionalmente, para rangos de
+temperatura, humedad y evapotranspiración. Toda la rejilla se puntúa en float64
+con una sola llamada a scaler + predict_proba, el mismo camino que Predecir, así
+que el cultivo recomendado en cada celda coincide con el de la predicción suelta.
+"""
+import numpy as np
+import pandas as pd
+
+from backend.caracteristicas import obtener_ensamblador
+from backend.metricas import medir
+from backend.predictors import COLUMNAS, VARS_CULT, VARS_FERT
+
+MESES = np.arange(1, 13)
+VARIABLES_BARRIDO = ["mes", "temperatura", "humedad", "evapotranspiracion"]
+
+
+def expandir_rejilla(muestra, encoders, meses=MESES, temperaturas=None, humedades=None,
+                     evapotranspiraciones=None):
+    """Array float64 (N, len(COLUMNAS)) con el producto cartesiano de los valores barridos.
+
+    `muestra` es un dict con las variables de COLUMNAS (categóricas como texto);
+    las variables sin rango toman su valor. Devuelve también un DataFrame con los
+    valores barridos de cada fila.
+    """
+    ensamblador = obtener_ensamblador(encoders)
+    base = np.empty(len(COLUMNAS), dtype=np.float64)
+    for j, col in enumerate(COLUMNAS):
+        valor = muestra[col]
+        if col in ensamblador.tablas:
+            valor = ensamblador.codigo(col, valor)
+            if valor < 0:
+                raise ValueError(f"Categoría desconocida en '{col}': {muestra[col]}")
+        base[j] = valor
+
+    ejes = {
+        "mes": meses,
+        "temperatura": temperaturas if temperaturas is not None else [muestra["temperatura"]],
+        "humedad": humedades if humedades is not None else [muestra["humedad"]],
+        "evapotranspiracion": evapotranspiraciones if evapotranspiraciones is not None else [muestra["evapotranspiracion"]],
+    }
+    mallas = np.meshgrid(*(np.asarray(v, dtype=np.float64) for v in ejes.values()), indexing="ij")
+    X = np.tile(base, (mallas[0].size, 1))
+    for col, malla in zip(ejes, mallas):
+        X[:, COLUMNAS.index(col)] = malla.ravel()
+    return X, pd.DataFrame({col: X[:, COLUMNAS.index(col)] for col in ejes})
+
+
+def barrer(muestra, modelos, k=3, **rangos):
+    """Puntúa toda la rejilla de `muestra` en una pasada.
+
+    `modelos` es la tupla de load_all_models y `rangos` los argumentos opcionales de
+    expandir_rejilla. Devuelve un dict con:
+      - "rejilla": un DataFrame por punto con los valores barridos, la probabilidad de
+        fertilidad y los `k` cultivos más probables (cultivo_1, prob_1, ...).
+      - "matriz": probabilidad media de cada cultivo por mes (mes x cultivo).
+      - "fertilidad": probabilidad media de que el suelo sea fértil.
+    """
+    modelo_fert, modelo_cult, scaler_fert, scaler_cult, encoders = modelos
+    X, rejilla = expandir_rejilla(muestra, encoders, **rangos)
+    df = pd.DataFrame(X, columns=COLUMNAS, copy=False)
+
+    with medir("barrido"):
+        # Las variables de fertilidad no se barren: basta con puntuar una fila
+        p_fert = modelo_fert.predict_proba(scaler_fert.transform(df.iloc[:1][VARS_FERT]))[:, 1]
+        p_fert = np.broadcast_to(p_fert, len(X))
+        p_cult = modelo_cult.predict_proba(scaler_cult.transform(df[VARS_CULT]))
+
+    cultivos = np.asarray(encoders["cultivo"].classes_)
+    k = min(k, len(cultivos))
+    mejores = np.argpartition(-p_cult, k - 1, axis=1)[:, :k]
+    mejores = np.take_along_axis(mejores, np.argsort(-np.take_along_axis(p_cult, mejores, 1), axis=1), 1)
+
+    rejilla["prob_fertilidad"] = p_fert
+    for i in range(k):
+        rejilla[f"cultivo_{i + 1}"] = cultivos[mejores[:, i]]
+        rejilla[f"prob_{i + 1}"] = p_cult[np.arange(len(X)), mejores[:, i]]
+
+    matriz = pd.DataFrame(p_cult, columns=cultivos).groupby(rejilla["mes"].astype(int).to_numpy()).mean()
+    matriz.index.name = "mes"
+    return {"rejilla": rejilla, "matriz": matriz, "fertilidad": float(p_fert.mean())}
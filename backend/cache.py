@@ -0,0 +1,132 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+CACHE_DIR = os.environ.get(
+    "PREDICC_CACHE_DIR",
+    os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".cache")),
+)
+
+
+class LRU:
+    """Diccionario acotado con desalojo LRU y contadores de aciertos/fallos."""
+
+    def __init__(self, max_items=1024):
+        self.max_items = max_items
+        self._datos = OrderedDict()
+        self._lock = threading.Lock()
+        self.aciertos = 0
+        self.fallos = 0
+        self.desalojos = 0
+
+    def get(self, clave, default=None):
+        with self._lock:
+            try:
+                valor = self._datos[clave]
+            except KeyError:
+                self.fallos += 1
+                return default
+            self._datos.move_to_end(clave)
+            self.aciertos += 1
+            return valor
+
+    def set(self, clave, valor):
+        with self._lock:
+            self._datos[clave] = valor
+            self._datos.move_to_end(clave)
+            while len(self._datos) > self.max_items:
+                self._datos.popitem(last=False)
+                self.desalojos += 1
+
+    def pop(self, clave, default=None):
+        with self._lock:
+            return self._datos.pop(clave, default)
+
+    def clear(self):
+        with self._lock:
+            self._datos.clear()
+
+    def __len__(self):
+        return len(self._datos)
+
+    def estadisticas(self):
+        return {
+            "items": len(self._datos),
+            "aciertos": self.aciertos,
+            "fallos": self.fallos,
+            "desalojos": self.desalojos,
+        }
+
+
+class CacheTTL:
+    """Caché de dos niveles: LRU en memoria delante de un almacén SQLite en disco.
+
+    `ttl` en segundos; None significa que las entradas no caducan. Los valores
+    deben ser serializables a JSON.
+    """
+
+    def __init__(self, espacio, ttl=None, ruta_db=None, max_memoria=1024):
+        self.espacio = espacio
+        self.ttl = ttl
+        self.ruta_db = ruta_db or os.path.join(CACHE_DIR, "cache.sqlite")
+        self._memoria = LRU(max_memoria)
+        self._lock = threading.Lock()
+        self._conn = None
+
+    def _conexion(self):
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.ruta_db), exist_ok=True)
+            conn = sqlite3.connect(self.ruta_db, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache ("
+                " espacio TEXT NOT NULL, clave TEXT NOT NULL,"
+                " valor TEXT NOT NULL, expira REAL,"
+                " PRIMARY KEY (espacio, clave))"
+            )
+            self._conn = conn
+        return self._conn
+
+    def get(self, clave):
+        ahora = time.time()
+        entrada = self._memoria.get(clave)
+        if entrada is not None:
+            valor, expira = entrada
+            if expira is None or expira > ahora:
+                return valor
+            self._memoria.pop(clave)
+
+        with self._lock:
+            fila = self._conexion().execute(
+                "SELECT valor, expira FROM cache WHERE espacio = ? AND clave = ?",
+                (self.espacio, clave),
+            ).fetchone()
+        if fila is None or (fila[1] is not None and fila[1] <= ahora):
+            return None
+        valor = json.loads(fila[0])
+        self._memoria.set(clave, (valor, fila[1]))
+        return valor
+
+    def set(self, clave, valor):
+        expira = None if self.ttl is None else time.time() + self.ttl
+        self._memoria.set(clave, (valor, expira))
+        with self._lock:
+            conn = self._conexion()
+            conn.execute(
+                "INSERT OR REPLACE INTO cache (espacio, clave, valor, expira) VALUES (?, ?, ?, ?)",
+                (self.espacio, clave, json.dumps(valor), expira),
+            )
+            conn.commit()
+
+    def limpiar(self):
+        self._memoria.clear()
+        with self._lock:
+            conn = self._conexion()
+            conn.execute("DELETE FROM cache WHERE espacio = ?", (self.espacio,))
+            conn.commit()
+
+    def estadisticas(self):
+        return {"espacio": self.espacio, "ttl": self.ttl, **self._memoria.estadisticas()}
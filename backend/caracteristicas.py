@@ -0,0 +1,102 @@
+import threading
+
+import numpy as np
+import pandas as pd
+
+from backend.metricas import medido
+from backend.predictors import VARS_CULT, VARS_FERT
+
+ORDENES = {"fert": VARS_FERT, "cult": VARS_CULT}
+
+
+class EnsambladorCaracteristicas:
+    """Codifica y ensambla filas de entrada directamente en buffers preasignados.
+
+    Se construye una vez a partir de label_encoders.pkl: para cada categórica guarda
+    un dict (búsqueda de un valor) y un índice hash (búsqueda vectorizada), evitando
+    la validación y el searchsorted de LabelEncoder.transform en cada petición.
+    Cada disposición de `ordenes` tiene su propio buffer float64, escrito en el
+    orden exacto de sus columnas.
+    """
+
+    def __init__(self, encoders, ordenes=ORDENES, capacidad=64):
+        self.ordenes = {nombre: list(cols) for nombre, cols in ordenes.items()}
+        self.clases = {col: np.asarray(enc.classes_) for col, enc in encoders.items() if col != "cultivo"}
+        self.tablas = {col: {clase: i for i, clase in enumerate(clases)} for col, clases in self.clases.items()}
+        self._indices = {col: pd.Index(clases) for col, clases in self.clases.items()}
+
+        self.columnas = []
+        self._posiciones = {}
+        for nombre, cols in self.ordenes.items():
+            for pos, col in enumerate(cols):
+                if col not in self._posiciones:
+                    self.columnas.append(col)
+                    self._posiciones[col] = []
+                self._posiciones[col].append((nombre, pos))
+
+        self.capacidad_inicial = capacidad
+        self._local = threading.local()  # un juego de buffers por hilo (sesión de Streamlit)
+
+    def codigo(self, col, valor):
+        """Código de un único valor, o -1 si la categoría no existe."""
+        return self.tablas[col].get(valor, -1)
+
+    def codificar(self, col, valores):
+        """Códigos de un array de valores y la máscara de categorías desconocidas."""
+        valores = np.asarray(valores).reshape(-1)
+        if valores.dtype.kind in "iuf":
+            # Ya codificado: solo se valida el rango
+            codigos = valores.astype(np.int64)
+            desconocidos = (codigos < 0) | (codigos >= len(self.clases[col])) | (codigos != valores)
+        else:
+            codigos = self._indices[col].get_indexer(valores)
+            desconocidos = codigos < 0
+        return codigos, desconocidos
+
+    def _buffers(self, n):
+        buffers = getattr(self._local, "buffers", None)
+        if buffers is None or len(next(iter(buffers.values()))) < n:
+            capacidad = max(self.capacidad_inicial, 1 << max(n - 1, 0).bit_length())
+            buffers = {nombre: np.empty((capacidad, len(cols))) for nombre, cols in self.ordenes.items()}
+            self._local.buffers = buffers
+        return buffers
+
+    @medido("codificacion")
+    def ensamblar(self, datos):
+        """Escribe `datos` (DataFrame o dict de columnas/escalares) en los buffers.
+
+        Devuelve un dict {disposición: vista (n, columnas)} y la máscara de filas con
+        alguna categoría desconocida (esas filas llevan -1 y no deben predecirse).
+        Las vistas se reutilizan en la siguiente llamada del mismo hilo.
+        """
+        n = len(datos) if isinstance(datos, pd.DataFrame) else max(np.size(datos[c]) for c in self.columnas)
+        buffers = self._buffers(n)
+        desconocidos = np.zeros(n, dtype=bool)
+        for col in self.columnas:
+            valores = datos[col]
+            if isinstance(valores, pd.Series):
+                valores = valores.to_numpy()
+            if col in self.tablas:
+                valores, mascara = self.codificar(col, valores)
+                desconocidos |= mascara
+            for nombre, pos in self._posiciones[col]:
+                buffers[nombre][:n, pos] = valores
+        return {nombre: buf[:n] for nombre, buf in buffers.items()}, desconocidos
+
+    def ensamblar_fila(self, **valores):
+        """Atajo para una única fila con valores escalares."""
+        vistas, desconocidos = self.ensamblar({col: [valores[col]] for col in self.columnas})
+        return vistas, bool(desconocidos[0])
+
+
+_ensambladores = {}
+
+
+def obtener_ensamblador(encoders):
+    """Ensamblador compartido para un juego de encoders (se recrea si el registro los recarga)."""
+    # Se guarda la referencia a los encoders para que su id no pueda reutilizarse
+    actual = _ensambladores.get("actual")
+    if actual is None or actual[0] is not encoders:
+        actual = (encoders, EnsambladorCaracteristicas(encoders))
+        _ensambladores["actual"] = actual
+    return actual[1]
@@ -0,0 +1,302 @@
+"""Predictor compilado: scaler fusionado en los umbrales de los árboles.
+
+Los árboles solo comparan `x_escalado < umbral`, y el StandardScaler es una
+transformación afín creciente, así que la comparación equivale a `x < umbral'`
+sobre el valor crudo. Al cargar se reescriben los umbrales (y los índices de
+variable, para que ambos boosters lean el mismo array en el orden de COLUMNAS)
+y en la predicción no hay DataFrame ni copia escalada.
+
+XGBoost compara en float32, y redondear a float32 una entrada float64 puede
+dejarla al otro lado de un umbral (los umbrales suelen caer justo en valores de
+entrenamiento con 2 decimales). Por eso, para cada umbral se calcula también la
+frontera float64 exacta del pipeline y cada valor de entrada se sustituye por un
+float32 representante de su intervalo entre fronteras: los árboles toman las
+mismas ramas que scaler (float64) + XGBoost. Si dos fronteras caen dentro del
+mismo float32 no hay representante posible; esas filas (rarísimas) se puntúan con
+scaler + predict_proba. Un array float32 contiguo no necesita representantes y va
+directo a los boosters, sin copias.
+
+Por debajo de FILAS_MAX_COMPILADO filas es varias veces más rápido que
+predecir_lote (sin DataFrame ni escalado); la app (predicción de una fila) y el
+servicio (micro-lotes) lo usan ahí. Con lotes grandes domina XGBoost y el pipeline
+vectorizado es igual o más rápido, así que ingesta y recálculo siguen con él.
+
+Verificación contra el pipeline actual:
+
+    python -m backend.compilado
+"""
+import json
+
+import numpy as np
+
+from backend.predictors import COLUMNAS, SIN_CULTIVO, VARS_CULT, VARS_FERT, predecir_ensamblado
+
+FILAS_MAX_COMPILADO = 1024
+
+
+def _umbral_crudo(umbral, media, escala):
+    """Menor float32 `v` tal que float32((v - media) / escala) >= umbral.
+
+    Con ese valor, `v < umbral_crudo` decide exactamente igual que el pipeline
+    scaler (float64) + XGBoost (float32) para cualquier entrada float32.
+    """
+    umbral = np.float32(umbral)
+
+    def _a_la_izquierda(v):
+        return np.float32((np.float64(v) - media) / escala) < umbral
+
+    v = np.float32(np.float64(umbral) * escala + media)
+    if _a_la_izquierda(v):
+        while _a_la_izquierda(v):
+            v = np.nextafter(v, np.float32(np.inf))
+    else:
+        while not _a_la_izquierda(np.nextafter(v, np.float32(-np.inf))):
+            v = np.nextafter(v, np.float32(-np.inf))
+    return float(v)
+
+
+def _orden(x):
+    # float64 -> int64 que conserva el orden (los negativos tienen el bit de signo)
+    i = np.asarray(x, dtype=np.float64).view(np.int64)
+    return np.where(i < 0, np.iinfo(np.int64).min - i, i)
+
+
+def _desde_orden(k):
+    return np.where(k < 0, np.iinfo(np.int64).min - k, k).astype(np.int64).view(np.float64)
+
+
+def _frontera_float64(umbral, media, escala, crudo):
+    """Menor float64 `x` tal que float32((x - media) / escala) >= umbral (vectorizado).
+
+    `crudo` es el resultado de _umbral_crudo: la frontera está en (anterior float32, crudo].
+    """
+    umbral = np.asarray(umbral, dtype=np.float32)
+    izquierda = _orden(np.nextafter(np.float32(crudo), np.float32(-np.inf)).astype(np.float64))
+    derecha = _orden(np.asarray(crudo, dtype=np.float64))
+    while np.any(derecha - izquierda > 1):
+        medio = izquierda + (derecha - izquierda) // 2
+        a_la_derecha = ~(((_desde_orden(medio) - media) / escala).astype(np.float32) < umbral)
+        derecha = np.where(a_la_derecha, medio, derecha)
+        izquierda = np.where(a_la_derecha, izquierda, medio)
+    return _desde_orden(derecha)
+
+
+def fusionar_booster(modelo, scaler, variables, columnas=COLUMNAS):
+    """Devuelve un xgboost.Booster que recibe valores crudos en el orden `columnas`."""
+    import xgboost as xgb
+
+    media, escala = _medias_escalas(scaler, variables)
+    posicion = [columnas.index(v) for v in variables]
+
+    modelo_json = json.loads(modelo.get_booster().save_raw("json"))
+    learner = modelo_json["learner"]
+    learner["learner_model_param"]["num_feature"] = str(len(columnas))
+    learner["feature_names"] = []
+    learner["feature_types"] = []
+
+    for arbol in learner["gradient_booster"]["model"]["trees"]:
+        arbol["tree_param"]["num_feature"] = str(len(columnas))
+        for nodo, izquierdo in enumerate(arbol["left_children"]):
+            if izquierdo == -1:  # hoja: split_conditions guarda el valor de la hoja
+                continue
+            j = arbol["split_indices"][nodo]
+            arbol["split_conditions"][nodo] = _umbral_crudo(arbol["split_conditions"][nodo], media[j], escala[j])
+            arbol["split_indices"][nodo] = posicion[j]
+
+    booster = xgb.Booster()
+    booster.load_model(bytearray(json.dumps(modelo_json).encode()))
+    return booster
+
+
+def _medias_escalas(scaler, variables):
+    media = np.zeros(len(variables)) if getattr(scaler, "mean_", None) is None else scaler.mean_
+    escala = np.ones(len(variables)) if getattr(scaler, "scale_", None) is None else scaler.scale_
+    return media, escala
+
+
+def umbrales(booster):
+    """Lista de (columna, umbral float32) de todos los nodos internos del booster."""
+    resultado = []
+    for arbol in json.loads(booster.save_raw("json"))["learner"]["gradient_booster"]["model"]["trees"]:
+        for nodo, izquierdo in enumerate(arbol["left_children"]):
+            if izquierdo != -1:
+                resultado.append((arbol["split_indices"][nodo], np.float32(arbol["split_conditions"][nodo])))
+    return resultado
+
+
+class PredictorCompilado:
+    """Fertilidad y cultivo a partir de un array (N, len(COLUMNAS)) codificado y sin escalar."""
+
+    def __init__(self, modelo_fert, modelo_cult, scaler_fert, scaler_cult):
+        self.modelos = (modelo_fert, modelo_cult, scaler_fert, scaler_cult)
+        self.booster_fert = fusionar_booster(modelo_fert, scaler_fert, VARS_FERT)
+        self.booster_cult = fusionar_booster(modelo_cult, scaler_cult, VARS_CULT)
+        self._pos_fert = [COLUMNAS.index(v) for v in VARS_FERT]
+        self._pos_cult = [COLUMNAS.index(v) for v in VARS_CULT]
+
+        # Por columna: fronteras float64 ordenadas, representante float32 de cada
+        # intervalo entre ellas y si el intervalo no tiene representante
+        pares = {}
+        for modelo, scaler, variables in ((modelo_fert, scaler_fert, VARS_FERT), (modelo_cult, scaler_cult, VARS_CULT)):
+            media, escala = _medias_escalas(scaler, variables)
+            for j, umbral in umbrales(modelo.get_booster()):
+                pares.setdefault(COLUMNAS.index(variables[j]), set()).add((umbral, media[j], escala[j]))
+        self._fronteras = {}
+        for columna, ternas in pares.items():
+            umbral, media, escala = (np.array(v) for v in zip(*sorted(ternas)))
+            crudo = np.array([_umbral_crudo(u, m, s) for u, m, s in zip(umbral, media, escala)], dtype=np.float32)
+            frontera = _frontera_float64(umbral, media, escala, crudo)
+            frontera, unicos = np.unique(frontera, return_index=True)
+            crudo = crudo[unicos]
+            representante = np.concatenate([[np.nextafter(crudo[0], np.float32(-np.inf))], crudo])
+            sin_representante = np.concatenate([[False], crudo[:-1] == crudo[1:], [False]])
+            self._fronteras[columna] = (frontera, representante,
+                                        sin_representante if sin_representante.any() else None)
+
+    def ajustar_hilos(self, hilos):
+        for booster in (self.booster_fert, self.booster_cult):
+            booster.set_param("nthread", hilos)
+
+    def _preparar(self, X):
+        """X, el array float32 que leen los boosters y las filas sin representante."""
+        X = np.asarray(X)
+        if X.dtype == np.float32:
+            # Los umbrales reescritos ya deciden exactamente para entradas float32
+            return X, np.ascontiguousarray(X), np.zeros(0, dtype=np.int64)
+        X = np.asarray(X, dtype=np.float64)
+        X32 = X.astype(np.float32)
+        colisiones = np.zeros(len(X), dtype=bool)
+        for j, (frontera, representante, sin_representante) in self._fronteras.items():
+            k = np.searchsorted(frontera, X[:, j], side="right")
+            X32[:, j] = representante[k]
+            if sin_representante is not None:
+                colisiones |= sin_representante[k]
+        # Los valores ausentes siguen ausentes (XGBoost los manda por la rama por defecto)
+        ausentes = np.isnan(X)
+        if ausentes.any():
+            X32[ausentes] = np.nan
+        return X, X32, np.flatnonzero(colisiones)
+
+    def _referencia(self, X):
+        import pandas as pd
+
+        df = pd.DataFrame(np.asarray(X, dtype=np.float64), columns=COLUMNAS)
+        return df[VARS_FERT], df[VARS_CULT]
+
+    def predecir_proba(self, X):
+        """Probabilidad de fertilidad (N,) y de cada cultivo (N, n_cultivos) para todas las filas."""
+        X, X32, dudosas = self._preparar(X)
+        p_fert, p_cult = self.booster_fert.inplace_predict(X32), self.booster_cult.inplace_predict(X32)
+        if len(dudosas):
+            modelo_fert, modelo_cult, scaler_fert, scaler_cult = self.modelos
+            X_fert, X_cult = self._referencia(X[dudosas])
+            p_fert[dudosas] = modelo_fert.predict_proba(scaler_fert.transform(X_fert))[:, 1]
+            p_cult[dudosas] = modelo_cult.predict_proba(scaler_cult.transform(X_cult))
+        return p_fert, p_cult
+
+    def predecir(self, X):
+        """Mismo contrato que predictors.predecir_lote, con X ya codificado (float32 o float64)."""
+        X, X32, dudosas = self._preparar(X)
+        fert_pred = (self.booster_fert.inplace_predict(X32) > 0.5).astype(np.int64)
+        cult_pred = np.full(len(X), SIN_CULTIVO, dtype=np.int64)
+        fertiles = fert_pred != 0
+        if fertiles.all():
+            cult_pred[:] = np.argmax(self.booster_cult.inplace_predict(X32), axis=1)
+        elif fertiles.any():
+            cult_pred[fertiles] = np.argmax(self.booster_cult.inplace_predict(X32[fertiles]), axis=1)
+        if len(dudosas):
+            fert_pred[dudosas], cult_pred[dudosas] = predecir_ensamblado(*self._referencia(X[dudosas]), *self.modelos)
+        return fert_pred, cult_pred
+
+    def predecir_ensamblado(self, X_fert, X_cult):
+        """Como predictors.predecir_ensamblado, con las vistas VARS_FERT/VARS_CULT del ensamblador."""
+        X = np.empty((len(X_fert), len(COLUMNAS)))
+        X[:, self._pos_fert] = X_fert
+        X[:, self._pos_cult] = X_cult
+        return self.predecir(X)
+
+
+_compilados = {}
+
+
+def obtener_predictor_compilado(modelo_fert, modelo_cult, scaler_fert, scaler_cult):
+    """Compila una vez por combinación de artefactos cargados (se recompila si el registro recarga)."""
+    # Se guardan las referencias a los artefactos para que sus id no puedan reutilizarse
+    artefactos = (modelo_fert, modelo_cult, scaler_fert, scaler_cult)
+    actual = _compilados.get("actual")
+    if actual is None or any(a is not b for a, b in zip(actual[0], artefactos)):
+        actual = (artefactos, PredictorCompilado(*artefactos))
+        _compilados["actual"] = actual
+    return actual[1]
+
+
+def corpus_verificacion(predictor, scaler_fert, scaler_cult, n=20000, semilla=0):
+    """Array float64 con muestras aleatorias float32 y float64 de 2 decimales.
+
+    Incluye filas con cada umbral y un ulp float32 por debajo, y filas float64 con
+    los valores de 2 decimales que rodean cada umbral (como los de registros_pp).
+    """
+    rng = np.random.default_rng(semilla)
+    media = np.zeros(len(COLUMNAS))
+    escala = np.ones(len(COLUMNAS))
+    for scaler, variables in ((scaler_fert, VARS_FERT), (scaler_cult, VARS_CULT)):
+        for v, m, s in zip(variables, scaler.mean_, scaler.scale_):
+            media[COLUMNAS.index(v)], escala[COLUMNAS.index(v)] = m, s
+    X = rng.normal(media, escala * 1.5, size=(n, len(COLUMNAS))).astype(np.float32)
+    X_2d = np.round(rng.normal(media, escala * 1.5, size=(n, len(COLUMNAS))), 2)
+
+    bordes = umbrales(predictor.booster_fert) + umbrales(predictor.booster_cult)
+    filas_borde = X[rng.integers(0, n, 2 * len(bordes))]
+    filas_borde_2d = X_2d[rng.integers(0, n, 3 * len(bordes))]
+    for k, (j, umbral) in enumerate(bordes):
+        filas_borde[2 * k, j] = umbral
+        filas_borde[2 * k + 1, j] = np.nextafter(umbral, np.float32(-np.inf))
+        cercano = np.round(float(umbral), 2)
+        filas_borde_2d[3 * k:3 * k + 3, j] = np.round([cercano - 0.01, cercano, cercano + 0.01], 2)
+    return np.vstack([X.astype(np.float64), filas_borde.astype(np.float64), X_2d, filas_borde_2d])
+
+
+def verificar(modelos, X=None):
+    """Compara predicción y probabilidades con el pipeline actual; devuelve un resumen."""
+    import pandas as pd
+
+    from backend.predictors import predecir_lote
+
+    modelo_fert, modelo_cult, scaler_fert, scaler_cult, encoders = modelos
+    predictor = PredictorCompilado(modelo_fert, modelo_cult, scaler_fert, scaler_cult)
+    if X is None:
+        X = corpus_verificacion(predictor, scaler_fert, scaler_cult)
+
+    df = pd.DataFrame(np.asarray(X, dtype=np.float64), columns=COLUMNAS)
+    fert_ref, cult_ref = predecir_lote(df, *modelos)
+    fert_new, cult_new = predictor.predecir(X)
+
+    proba_fert_ref = modelo_fert.predict_proba(scaler_fert.transform(df[VARS_FERT]))[:, 1]
+    proba_cult_ref = modelo_cult.predict_proba(scaler_cult.transform(df[VARS_CULT]))
+    proba_fert_new, proba_cult_new = predictor.predecir_proba(X)
+
+    # Camino float32 (sin representantes) sobre las filas que float32 representa exactamente
+    X = np.asarray(X, dtype=np.float64)
+    en_float32 = (X.astype(np.float32).astype(np.float64) == X).all(axis=1)
+    fert_32, cult_32 = predictor.predecir(np.ascontiguousarray(X[en_float32], dtype=np.float32))
+
+    return {
+        "filas": len(X),
+        "filas_float32": int(en_float32.sum()),
+        "fertilidad_distinta_float32": int((fert_ref[en_float32] != fert_32).sum()),
+        "cultivo_distinto_float32": int((cult_ref[en_float32] != cult_32).sum()),
+        "fertilidad_distinta": int((fert_ref != fert_new).sum()),
+        "cultivo_distinto": int((cult_ref != cult_new).sum()),
+        "proba_fertilidad_distinta": int((proba_fert_ref.astype(np.float32) != proba_fert_new).sum()),
+        "proba_cultivo_distinta": int((proba_cult_ref.astype(np.float32) != proba_cult_new).any(axis=1).sum()),
+    }
+
+
+if __name__ == "__main__":
+    from backend.loaders import load_all_models
+
+    resumen = verificar(load_all_models())
+    print(json.dumps(resumen, indent=2))
+    identico = all(v == 0 for k, v in resumen.items() if not k.startswith("filas"))
+    print("OK: idéntico bit a bit" if identico else "DIFERENCIAS encontradas")
+    raise SystemExit(0 if identico else 1)
@@ -1,44 +1,194 @@
-from supabase import create_client
 import os
+import uuid
 from datetime import datetime
-import streamlit as st
 import pytz
 import pandas as pd
 
-# Conexión a Supabase usando st.secrets o variables de entorno
-SUPABASE_URL = st.secrets["supabase"]["url"]
-SUPABASE_KEY = st.secrets["supabase"]["anon_key"]
+from backend.agregados import obtener_agregados
+from backend.almacenamiento import obtener_almacenamiento
+from backend.cache import CACHE_DIR
+from backend.escritura import obtener_escritor
+from backend.espacial import indice_si_existe
+from backend.metricas import medido
 
-supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
+# El backend (Supabase o SQLite local) se elige con PREDICC_ALMACENAMIENTO y se
+# construye en la primera operación, no al importar este módulo.
 
+
+def fecha_hoy():
+    tz = pytz.timezone("America/Lima")
+    return datetime.now(tz).strftime("%Y-%m-%d")
+
+
+@medido("guardar")
 def guardar(data_dict):
-    """Guarda una predicción en la tabla registros_pp."""
+    """Encola una predicción para registros_pp y devuelve su clave de idempotencia.
+
+    La inserción real la hace en segundo plano el escritor diferido (backend.escritura).
+    """
+    import streamlit as st
+
     try:
-        tz = pytz.timezone("America/Lima")
-        data_dict["fecha_ingreso"] = datetime.now(tz).strftime("%Y-%m-%d")
+        data_dict["fecha_ingreso"] = fecha_hoy()
         data_dict["prediccion"] = True
-        response = supabase.table("registros_pp").insert(data_dict).execute()
-        st.success("✅ Registro guardado exitosamente.")
-        return response
+        clave = obtener_escritor().encolar(data_dict)
+        st.success("📥 Registro en cola: se guardará en segundo plano.")
+        return clave
     except Exception as e:
-        st.error(f"❌ Error al insertar en Supabase: {e}")
+        st.error(f"❌ Error al guardar el registro: {e}")
         return None
 
 
-def obtener_registros():
-    """Obtiene todos los registros ordenados por fecha."""
+def registrar_inserciones(filas):
+    """Propaga filas ya insertadas a los resúmenes y al índice espacial (si está construido)."""
+    obtener_agregados().registrar_inserciones(filas)
+    indice = indice_si_existe()
+    if indice is not None:
+        indice.agregar_filas(filas)
+
+
+def insertar_lote(registros, tam_lote=500):
+    """Inserta muchas predicciones con inserciones multi-fila de `tam_lote` filas.
+
+    Pensada para procesos sin interfaz: no usa st.* y propaga los errores. Las
+    filas sin `clave_idempotencia` reciben una nueva; las que ya existían se
+    ignoran. Devuelve el número de filas insertadas.
+    """
+    fecha = fecha_hoy()
+    filas = [{**r, "fecha_ingreso": fecha, "prediccion": True,
+              "clave_idempotencia": r.get("clave_idempotencia") or uuid.uuid4().hex} for r in registros]
+    almacenamiento = obtener_almacenamiento()
+    insertadas = 0
+    for inicio in range(0, len(filas), tam_lote):
+        nuevas = almacenamiento.insertar_lote_idempotente(filas[inicio:inicio + tam_lote])
+        registrar_inserciones(nuevas)
+        insertadas += len(nuevas)
+    return insertadas
+
+
+def _confirmadas(anteriores, filas):
+    """Filas de `anteriores` cuyo id aparece en `filas` (lo que el backend confirma haber cambiado)."""
+    ids = {int(f["id"]) for f in filas}
+    return [a for a in anteriores if int(a["id"]) in ids]
+
+
+def actualizar_predicciones(cambios, tam_lote=500):
+    """Actualiza fertilidad y cultivo de muchos registros con updates agrupados.
+
+    `cambios` es una lista de dicts con id, fertilidad y cultivo. Las filas con la
+    misma predicción se actualizan juntas con un único `update ... where id in (...)`.
+    """
+    grupos = {}
+    for cambio in cambios:
+        grupos.setdefault((int(cambio["fertilidad"]), cambio["cultivo"]), []).append(int(cambio["id"]))
+
+    almacenamiento = obtener_almacenamiento()
+    actualizadas = 0
+    for (fertilidad, cultivo), ids in grupos.items():
+        datos = {"fertilidad": fertilidad, "cultivo": cultivo}
+        for inicio in range(0, len(ids), tam_lote):
+            lote = ids[inicio:inicio + tam_lote]
+            anteriores = almacenamiento.seleccionar_ids(lote)
+            filas = almacenamiento.actualizar_ids(lote, datos)
+            obtener_agregados().registrar_actualizaciones(_confirmadas(anteriores, filas), filas)
+            if indice_si_existe() is not None:
+                indice_si_existe().agregar_filas(filas)
+            actualizadas += len(filas)
+    return actualizadas
+
+
+@medido("obtener_registros")
+def obtener_pagina(limite=50, despues_de_id=None, columnas=None, desde=None, hasta=None,
+                   cultivo=None, fertilidad=None):
+    """Obtiene una página de registros ordenada por id (paginación por cursor).
+
+    Devuelve el DataFrame de la página y el id a usar como `despues_de_id` para
+    la siguiente, o None si no hay más registros. Si el backend no devuelve
+    `limite` + 1 filas por consulta, la página se acorta a lo que sí devuelve.
+    """
+    if columnas and "id" not in columnas:
+        columnas = ["id", *columnas]
+    almacenamiento = obtener_almacenamiento()
+    if almacenamiento.max_filas:
+        limite = max(min(limite, almacenamiento.max_filas - 1), 1)
+    # Se pide una fila de más: solo si llega hay una página siguiente
+    filas = almacenamiento.seleccionar(
+        columnas, despues_de_id, limite + 1, orden="id",
+        desde=desde, hasta=hasta, cultivo=cultivo, fertilidad=fertilidad,
+    )
+    pagina = pd.DataFrame(filas[:limite])
+    siguiente = int(pagina["id"].iloc[-1]) if len(filas) > limite else None
+    return pagina, siguiente
+
+
+def iterar_paginas(tam_pagina=1000, despues_de_id=None, columnas=None, **filtros):
+    """Recorre los registros página a página sin cargarlos todos en memoria.
+
+    Termina con la primera página vacía y no con una corta: un backend puede
+    devolver menos filas de las pedidas aunque queden más.
+    """
+    if columnas and "id" not in columnas:
+        columnas = ["id", *columnas]
+    almacenamiento = obtener_almacenamiento()
+    if almacenamiento.max_filas:
+        tam_pagina = min(tam_pagina, almacenamiento.max_filas)
+    while True:
+        filas = almacenamiento.seleccionar(columnas, despues_de_id, tam_pagina, orden="id", **filtros)
+        if not filas:
+            return
+        pagina = pd.DataFrame(filas)
+        yield pagina
+        despues_de_id = int(pagina["id"].iloc[-1])
+
+
+@medido("obtener_registros")
+def obtener_registros(columnas=None, desde=None, hasta=None, cultivo=None, fertilidad=None):
+    """Obtiene los registros (filtrados en el servidor) ordenados por fecha."""
+    import streamlit as st
+
     try:
-        response = supabase.table("registros_pp").select("*").order("fecha_ingreso", desc=True).execute()
-        return pd.DataFrame(response.data)
+        filas = obtener_almacenamiento().seleccionar(
+            columnas, orden="fecha_ingreso", desc=True,
+            desde=desde, hasta=hasta, cultivo=cultivo, fertilidad=fertilidad,
+        )
+        return pd.DataFrame(filas)
     except Exception as e:
         st.error(f"❌ Error al obtener registros: {e}")
         return pd.DataFrame()
 
 
+def sincronizar_registros(ruta_snapshot=None, columnas=None, tam_pagina=1000):
+    """Actualiza una copia local de registros_pp trayendo solo los ids nuevos.
+
+    Solo detecta inserciones: las ediciones o borrados de filas ya sincronizadas
+    requieren borrar el snapshot para forzar una descarga completa.
+    """
+    ruta_snapshot = ruta_snapshot or os.path.join(CACHE_DIR, "registros_pp.pkl")
+    snapshot = pd.read_pickle(ruta_snapshot) if os.path.exists(ruta_snapshot) else pd.DataFrame()
+    ultimo_id = int(snapshot["id"].max()) if not snapshot.empty else None
+
+    nuevas = list(iterar_paginas(tam_pagina, ultimo_id, columnas=columnas))
+    if nuevas:
+        snapshot = pd.concat([snapshot, *nuevas], ignore_index=True)
+        os.makedirs(os.path.dirname(ruta_snapshot), exist_ok=True)
+        snapshot.to_pickle(ruta_snapshot)
+    return snapshot
+
+
 def eliminar_registro(id_registro):
     """Elimina un registro por su ID."""
+    import streamlit as st
+
     try:
-        supabase.table("registros_pp").delete().eq("id", id_registro).execute()
+        # Solo se descuenta lo que el backend confirma haber borrado (RLS puede impedirlo sin error)
+        eliminadas = obtener_almacenamiento().eliminar(id_registro)
+        if not eliminadas:
+            st.warning(f"⚠️ No se eliminó ningún registro con ID {id_registro}.")
+            return
+        obtener_agregados().registrar_eliminaciones(eliminadas)
+        if indice_si_existe() is not None:
+            for fila in eliminadas:
+                indice_si_existe().eliminar_id(fila["id"])
         st.success(f"🗑️ Registro con ID {id_registro} eliminado correctamente.")
     except Exception as e:
         st.error(f"❌ Error al eliminar registro: {e}")
@@ -47,34 +197,31 @@ def eliminar_registro(id_registro):
 # --- Función para actualizar en Supabase ---
 
 def actualizar_registro(id_sel, datos_a_guardar):
+    import streamlit as st
+
     try:
-        st.write("🆔 ID que se intenta actualizar:", id_registro)
-        st.write("📦 Nuevos valores que se intentan guardar:", nuevos_valores)
-
-        # Ejecutar la actualización forzada
-        response = (
-            supabase
-            .table("registros_pp")
-            .update(datos_a_guardar)
-            .eq("id", id_registro)
-            .select("*")  # Devuelve la fila actualizada
-            .execute()
-        )
+        st.write("🆔 ID que se intenta actualizar:", id_sel)
+        st.write("📦 Nuevos valores que se intentan guardar:", datos_a_guardar)
+
+        # Ejecutar la actualización forzada (devuelve la fila actualizada)
+        almacenamiento = obtener_almacenamiento()
+        anteriores = almacenamiento.seleccionar_ids([id_sel])
+        filas = almacenamiento.actualizar(id_sel, datos_a_guardar) or []
+        obtener_agregados().registrar_actualizaciones(_confirmadas(anteriores, filas), filas)
+        if indice_si_existe() is not None:
+            indice_si_existe().agregar_filas(filas)
 
         # Mostrar la respuesta completa
-        st.write("✅ Respuesta de Supabase:", response)
+        st.write("✅ Respuesta de Supabase:", filas)
 
         # Validar si se actualizó algo
-        if response.data:
+        if filas:
             st.success("🎉 Registro actualizado correctamente.")
         else:
             st.warning("⚠️ La operación se ejecutó, pero no se actualizó ningún registro. Verifica si el ID existe o si los datos son iguales.")
 
-        return response
+        return filas
 
     except Exception as e:
         st.error(f"❌ Error actualizando el registro: {e}")
         return None
-
-
-
@@ -0,0 +1,285 @@
+"""Escritura diferida de registros con una cola local duradera.
+
+`guardar` deja cada registro en un spool SQLite y vuelve enseguida; un hilo en
+segundo plano lo vuelca a registros_pp en lotes, con reintentos y espera
+exponencial. Cada fila lleva una clave de idempotencia, de modo que reenviar un
+lote tras un fallo parcial no duplica registros. En Supabase, registros_pp debe
+tener una columna `clave_idempotencia` con restricción UNIQUE (migración en
+supabase/migrations/).
+
+Los errores transitorios (red, 5xx, permisos o credenciales, migración pendiente)
+se reintentan sin sacar nada del spool; una fila que el almacenamiento rechaza de
+forma permanente (columna desconocida, tipo inválido...) se aparta a la tabla
+`muertas` del spool para que no bloquee a las que vienen detrás, y `reencolar`
+la devuelve a la cola cuando se ha corregido la causa. El spool
+es un archivo local: en despliegues efímeros (Streamlit Cloud) se pierde al
+redesplegar, por eso se intenta vaciar al cerrar el proceso.
+"""
+import atexit
+import json
+import os
+import random
+import sqlite3
+import threading
+import time
+import uuid
+
+from backend.almacenamiento import obtener_almacenamiento
+from backend.cache import CACHE_DIR
+
+
+class EscritorDiferido:
+    """Cola duradera + hilo que vuelca a `almacenamiento` en lotes de `tam_lote`."""
+
+    def __init__(self, ruta_spool=None, almacenamiento=None, tam_lote=100, intervalo=1.0,
+                 espera_base=0.5, espera_max=60.0, al_volcar=None):
+        self.ruta_spool = ruta_spool or os.path.join(CACHE_DIR, "spool_registros.sqlite")
+        self._almacenamiento = almacenamiento
+        self.tam_lote = tam_lote
+        self.intervalo = intervalo
+        self.espera_base = espera_base
+        self.espera_max = espera_max
+        self.al_volcar = al_volcar  # callable(filas insertadas) tras confirmar cada lote en el spool
+
+        self._conn = None
+        self._lock = threading.Lock()
+        self._hay_datos = threading.Event()
+        self._detener = threading.Event()
+        self._hilo = None
+        self._fallos_seguidos = 0
+        self._stats = {"volcadas": 0, "muertas": 0, "lotes": 0, "fallos": 0, "ultimo_error": None,
+                       "latencia_ultimo_s": None, "latencia_total_s": 0.0}
+
+    @property
+    def almacenamiento(self):
+        return self._almacenamiento or obtener_almacenamiento()
+
+    def _conexion(self):
+        if self._conn is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.ruta_spool)), exist_ok=True)
+            conn = sqlite3.connect(self.ruta_spool, check_same_thread=False)
+            conn.executescript(
+                "PRAGMA journal_mode=WAL;"
+                "PRAGMA synchronous=FULL;"
+                "CREATE TABLE IF NOT EXISTS spool ("
+                " seq INTEGER PRIMARY KEY AUTOINCREMENT,"
+                " clave TEXT NOT NULL UNIQUE,"
+                " fila TEXT NOT NULL,"
+                " creado REAL NOT NULL);"
+                "CREATE TABLE IF NOT EXISTS muertas ("
+                " seq INTEGER PRIMARY KEY AUTOINCREMENT,"
+                " clave TEXT NOT NULL,"
+                " fila TEXT NOT NULL,"
+                " error TEXT NOT NULL,"
+                " creado REAL NOT NULL);"
+            )
+            self._conn = conn
+        return self._conn
+
+    def encolar(self, fila):
+        """Guarda `fila` en el spool y devuelve su clave de idempotencia."""
+        clave = fila.get("clave_idempotencia") or uuid.uuid4().hex
+        fila = {**fila, "clave_idempotencia": clave}
+        with self._lock:
+            conn = self._conexion()
+            with conn:
+                conn.execute("INSERT OR IGNORE INTO spool (clave, fila, creado) VALUES (?, ?, ?)",
+                             (clave, json.dumps(fila, default=_a_json), time.time()))
+        self.iniciar()
+        self._hay_datos.set()
+        return clave
+
+    def profundidad(self):
+        with self._lock:
+            return self._conexion().execute("SELECT COUNT(*) FROM spool").fetchone()[0]
+
+    def muertas(self, limite=50):
+        """Filas apartadas por errores permanentes, de la más reciente a la más antigua."""
+        with self._lock:
+            filas = self._conexion().execute(
+                "SELECT clave, fila, error, creado FROM muertas ORDER BY seq DESC LIMIT ?", (limite,)
+            ).fetchall()
+        return [{"clave": c, "fila": json.loads(f), "error": e, "creado": t} for c, f, e, t in filas]
+
+    def reencolar(self, claves=None):
+        """Devuelve al spool las filas apartadas (todas o las de `claves`); devuelve cuántas."""
+        consulta, params = "SELECT seq, clave, fila FROM muertas", []
+        if claves is not None:
+            claves = list(claves)
+            consulta += f" WHERE clave IN ({', '.join('?' for _ in claves)})"
+            params = claves
+        with self._lock:
+            conn = self._conexion()
+            with conn:
+                filas = conn.execute(consulta, params).fetchall()
+                conn.executemany("INSERT OR IGNORE INTO spool (clave, fila, creado) VALUES (?, ?, ?)",
+                                 [(clave, fila, time.time()) for _, clave, fila in filas])
+                conn.executemany("DELETE FROM muertas WHERE seq = ?", [(seq,) for seq, _, _ in filas])
+        if filas:
+            self.iniciar()
+            self._hay_datos.set()
+        return len(filas)
+
+    def _por_filas(self, pendientes):
+        """Reenvía un lote rechazado fila a fila para aislar las que fallan siempre."""
+        hechas, insertadas, muertas = [], [], []
+        for seq, fila in pendientes:
+            try:
+                insertadas += self.almacenamiento.insertar_lote_idempotente([fila])
+            except Exception as e:
+                if not es_error_permanente(e):
+                    return hechas, insertadas, muertas, e
+                muertas.append((seq, fila, repr(e)))
+                continue
+            hechas.append((seq, fila))
+        return hechas, insertadas, muertas, None
+
+    def volcar_lote(self):
+        """Envía el lote más antiguo del spool. Devuelve cuántas filas salieron (0 si vacío).
+
+        Propaga los errores transitorios; las filas no confirmadas siguen en el spool.
+        """
+        with self._lock:
+            pendientes = [(seq, json.loads(fila)) for seq, fila in self._conexion().execute(
+                "SELECT seq, fila FROM spool ORDER BY seq LIMIT ?", (self.tam_lote,)
+            )]
+        if not pendientes:
+            return 0
+
+        inicio = time.perf_counter()
+        error = None
+        try:
+            insertadas = self.almacenamiento.insertar_lote_idempotente([fila for _, fila in pendientes])
+            hechas, muertas = pendientes, []
+        except Exception as e:
+            if not es_error_permanente(e):
+                raise
+            hechas, insertadas, muertas, error = self._por_filas(pendientes)
+        latencia = time.perf_counter() - inicio
+
+        with self._lock:
+            conn = self._conexion()
+            with conn:
+                conn.executemany("INSERT INTO muertas (clave, fila, error, creado) VALUES (?, ?, ?, ?)",
+                                 [(f["clave_idempotencia"], json.dumps(f, default=_a_json), err, time.time())
+                                  for _, f, err in muertas])
+                conn.executemany("DELETE FROM spool WHERE seq = ?",
+                                 [(seq,) for seq, *_ in hechas + muertas])
+        self._stats["volcadas"] += len(hechas)
+        self._stats["muertas"] += len(muertas)
+        self._stats["lotes"] += 1
+        self._stats["latencia_ultimo_s"] = latencia
+        self._stats["latencia_total_s"] += latencia
+        if muertas:
+            self._stats["ultimo_error"] = muertas[-1][2]
+
+        # Solo después de sacar el lote del spool y solo con las filas nuevas: un
+        # reenvío (claves ya insertadas) no vuelve a contar en los resúmenes
+        if self.al_volcar is not None and insertadas:
+            try:
+                self.al_volcar(insertadas)
+            except Exception as e:
+                self._stats["ultimo_error"] = repr(e)
+        if error is not None:
+            raise error
+        return len(hechas) + len(muertas)
+
+    def vaciar(self):
+        """Vuelca todo el spool en el hilo actual (p. ej. al cerrar o en pruebas)."""
+        total = 0
+        while True:
+            n = self.volcar_lote()
+            if n == 0:
+                return total
+            total += n
+
+    def _espera(self):
+        espera = min(self.espera_max, self.espera_base * 2 ** (self._fallos_seguidos - 1))
+        return espera * random.uniform(0.5, 1.0)
+
+    def _bucle(self):
+        while not self._detener.is_set():
+            self._hay_datos.wait(self.intervalo)
+            self._hay_datos.clear()
+            try:
+                while self.volcar_lote() and not self._detener.is_set():
+                    pass
+                self._fallos_seguidos = 0
+            except Exception as e:
+                self._fallos_seguidos += 1
+                self._stats["fallos"] += 1
+                self._stats["ultimo_error"] = repr(e)
+                self._detener.wait(self._espera())
+                self._hay_datos.set()
+
+    def iniciar(self):
+        if self._hilo is None or not self._hilo.is_alive():
+            with self._lock:
+                if self._hilo is None or not self._hilo.is_alive():
+                    self._detener.clear()
+                    self._hilo = threading.Thread(target=self._bucle, name="escritor-diferido", daemon=True)
+                    self._hilo.start()
+                    self._hay_datos.set()  # volcar lo que quedó de una ejecución anterior
+
+    def detener(self, timeout=5.0, vaciar=False):
+        self._detener.set()
+        self._hay_datos.set()
+        if self._hilo is not None:
+            self._hilo.join(timeout)
+        if vaciar:
+            try:
+                self.vaciar()
+            except Exception as e:
+                self._stats["ultimo_error"] = repr(e)
+
+    def estadisticas(self):
+        lotes = self._stats["lotes"]
+        with self._lock:
+            apartadas = self._conexion().execute("SELECT COUNT(*) FROM muertas").fetchone()[0]
+        return {
+            "profundidad": self.profundidad(),
+            "apartadas": apartadas,
+            "fallos_seguidos": self._fallos_seguidos,
+            "latencia_media_s": self._stats["latencia_total_s"] / lotes if lotes else None,
+            **self._stats,
+        }
+
+
+def es_error_permanente(error):
+    """True si reintentar la misma fila no puede funcionar (datos o esquema inválidos)."""
+    if isinstance(error, json.JSONDecodeError):
+        return False  # respuesta cortada o página de error de un proxy
+    if isinstance(error, (ValueError, TypeError, KeyError)):
+        return True
+    codigo = str(getattr(error, "code", "") or "")
+    # Permisos (42501, RLS) y autenticación (PGRST3xx, JWT) dependen de la clave o la
+    # política, no de la fila: se reintentan hasta que se corrijan
+    if codigo == "42501" or codigo.startswith("PGRST3"):
+        return False
+    # APIError de PostgREST: códigos PGRST* y clases 22 (datos), 23 (restricciones) y 42 (esquema)
+    return codigo.startswith(("PGRST", "22", "23", "42"))
+
+
+def _a_json(valor):
+    # Escalares de NumPy que llegan desde los formularios
+    if hasattr(valor, "item"):
+        return valor.item()
+    raise TypeError(f"No serializable: {type(valor).__name__}")
+
+
+_escritor = None
+_lock_escritor = threading.Lock()
+
+
+def obtener_escritor():
+    """Escritor compartido del proceso; arranca su hilo y vuelca lo pendiente al crearse."""
+    global _escritor
+    if _escritor is None:
+        with _lock_escritor:
+            if _escritor is None:
+                from backend.database import registrar_inserciones
+
+                _escritor = EscritorDiferido(al_volcar=registrar_inserciones)
+                _escritor.iniciar()
+                atexit.register(_escritor.detener, vaciar=True)
+    return _escritor
@@ -0,0 +1,131 @@
+"""Índice espacial en rejilla sobre las coordenadas de registros_pp.
+
+Los puntos se agrupan en celdas de `tam_celda` grados; una búsqueda de radio R
+solo examina las celdas que cubren R, así que el coste depende de la densidad
+local y no del tamaño de la tabla.
+"""
+import math
+import threading
+
+import numpy as np
+
+RADIO_TIERRA_KM = 6371.0088
+KM_POR_GRADO = math.pi * RADIO_TIERRA_KM / 180
+
+COLUMNAS_INDICE = ["id", "latitud", "longitud", "altitud", "cultivo", "fertilidad", "fecha_ingreso", "lugar"]
+
+
+def distancia_km(lat1, lon1, lat2, lon2):
+    """Distancia haversine; admite arrays en el segundo punto."""
+    lat1, lon1, lat2, lon2 = map(np.radians, (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * RADIO_TIERRA_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+def _valido(valor):
+    return valor is not None and not (isinstance(valor, float) and math.isnan(valor))
+
+
+class IndiceEspacial:
+    def __init__(self, tam_celda=0.05):
+        self.tam_celda = tam_celda
+        self._celdas = {}
+        self._por_id = {}
+        self._n = 0
+        self._lock = threading.Lock()
+
+    def _celda(self, lat, lon):
+        return int(math.floor(lat / self.tam_celda)), int(math.floor(lon / self.tam_celda))
+
+    def agregar(self, lat, lon, datos):
+        celda = self._celda(lat, lon)
+        entrada = (float(lat), float(lon), datos)
+        with self._lock:
+            id_registro = datos.get("id")
+            if _valido(id_registro):
+                self._eliminar_id(int(id_registro))
+                self._por_id[int(id_registro)] = (celda, entrada)
+            self._celdas.setdefault(celda, []).append(entrada)
+            self._n += 1
+
+    def agregar_filas(self, filas):
+        """Añade filas de registros_pp; las que no tienen id o coordenadas se ignoran.
+
+        Sin id la entrada no se podría borrar ni reemplazar al editar el registro, así
+        que las filas recién insertadas deben llegar como las devuelve el almacenamiento.
+        """
+        for fila in filas:
+            lat, lon = fila.get("latitud"), fila.get("longitud")
+            if _valido(fila.get("id")) and _valido(lat) and _valido(lon):
+                self.agregar(lat, lon, {c: fila.get(c) for c in COLUMNAS_INDICE if c not in ("latitud", "longitud")})
+
+    def _eliminar_id(self, id_registro):
+        anterior = self._por_id.pop(id_registro, None)
+        if anterior is not None:
+            celda, entrada = anterior
+            self._celdas[celda].remove(entrada)
+            self._n -= 1
+
+    def eliminar_id(self, id_registro):
+        with self._lock:
+            self._eliminar_id(int(id_registro))
+
+    def cercanos(self, lat, lon, k=5, radio_km=10.0):
+        """Hasta `k` puntos a menos de `radio_km`, del más cercano al más lejano.
+
+        Devuelve una lista de (distancia_km, latitud, longitud, datos).
+        """
+        d_lat = radio_km / KM_POR_GRADO
+        d_lon = radio_km / (KM_POR_GRADO * max(math.cos(math.radians(lat)), 1e-6))
+        (f0, c0), (f1, c1) = self._celda(lat - d_lat, lon - d_lon), self._celda(lat + d_lat, lon + d_lon)
+        with self._lock:
+            candidatos = [e for f in range(f0, f1 + 1) for c in range(c0, c1 + 1) for e in self._celdas.get((f, c), ())]
+        if not candidatos:
+            return []
+        coords = np.array([(e[0], e[1]) for e in candidatos])
+        distancias = distancia_km(lat, lon, coords[:, 0], coords[:, 1])
+        dentro = np.flatnonzero(distancias <= radio_km)
+        orden = dentro[np.argsort(distancias[dentro], kind="stable")][:k]
+        return [(float(distancias[i]), *candidatos[i]) for i in orden]
+
+    def altitud_cercana(self, lat, lon, radio_km=0.2):
+        """Altitud del punto muestreado más cercano dentro de `radio_km`, o None.
+
+        Se saltan las altitudes vacías, no numéricas o en 0 (valor por defecto de
+        registros a los que nunca se les consultó la altitud).
+        """
+        for _, _, _, datos in self.cercanos(lat, lon, k=5, radio_km=radio_km):
+            try:
+                altitud = float(datos.get("altitud"))
+            except (TypeError, ValueError):
+                continue
+            if math.isfinite(altitud) and altitud != 0:
+                return altitud
+        return None
+
+    def __len__(self):
+        return self._n
+
+
+_indice = None
+_lock_indice = threading.Lock()
+
+
+def obtener_indice():
+    """Índice del proceso; la primera vez se llena con una lectura paginada de las coordenadas."""
+    global _indice
+    if _indice is None:
+        with _lock_indice:
+            if _indice is None:
+                from backend.database import iterar_paginas
+
+                indice = IndiceEspacial()
+                for pagina in iterar_paginas(2000, columnas=COLUMNAS_INDICE):
+                    indice.agregar_filas(pagina.to_dict("records"))
+                _indice = indice
+    return _indice
+
+
+def indice_si_existe():
+    """Índice ya construido, sin disparar la lectura inicial."""
+    return _indice
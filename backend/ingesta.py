@@ -0,0 +1,189 @@
+"""Ingesta masiva de análisis de suelo desde CSV o Parquet.
+
+Uso (sin Streamlit; credenciales en SUPABASE_URL y SUPABASE_ANON_KEY):
+
+    python -m backend.ingesta analisis.csv --tam-bloque 5000 --tam-insercion 500
+
+Cada fila se inserta con la clave de idempotencia `<hash del archivo>:<número de
+fila>` y el progreso se guarda como la fila por la que seguir, así que reanudar
+(con otro --tam-bloque o tras un corte a mitad de bloque) no salta ni duplica filas.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from backend.caracteristicas import obtener_ensamblador
+from backend.loaders import _checksum, load_all_models
+from backend.predictors import COLUMNAS, SIN_CULTIVO, predecir_lote
+
+CATEGORICAS = ["tipo_suelo", "condiciones_clima"]
+NUMERICAS = [c for c in COLUMNAS if c not in CATEGORICAS and c != "mes"]
+OPCIONALES = ["lugar", "latitud", "longitud"]
+
+
+def leer_por_bloques(ruta, tam_bloque=5000):
+    """Genera DataFrames de hasta `tam_bloque` filas sin cargar el archivo completo."""
+    if ruta.lower().endswith((".parquet", ".pq")):
+        try:
+            import pyarrow.parquet as pq
+        except ImportError as err:
+            raise RuntimeError("Leer Parquet requiere el paquete 'pyarrow'.") from err
+        for lote in pq.ParquetFile(ruta).iter_batches(batch_size=tam_bloque):
+            yield lote.to_pandas()
+    else:
+        yield from pd.read_csv(ruta, chunksize=tam_bloque)
+
+
+def preparar_bloque(bloque, encoders):
+    """Valida y codifica un bloque.
+
+    Devuelve el bloque válido (valores originales), su versión codificada para
+    los modelos y el número de filas descartadas.
+    """
+    faltantes = [c for c in COLUMNAS if c not in bloque.columns]
+    if faltantes:
+        raise ValueError(f"Faltan columnas en el archivo: {faltantes}")
+
+    bloque = bloque.copy()
+    for col in NUMERICAS + ["mes"]:
+        bloque[col] = pd.to_numeric(bloque[col], errors="coerce")
+
+    ensamblador = obtener_ensamblador(encoders)
+    codigos = {}
+    validas = bloque[COLUMNAS].notna().all(axis=1).to_numpy().copy()
+    for col in CATEGORICAS:
+        codigos[col], desconocidos = ensamblador.codificar(col, bloque[col].astype(str).to_numpy())
+        validas &= ~desconocidos
+    validas &= bloque["mes"].between(1, 12).to_numpy()
+
+    bloque = bloque[validas]
+    codificado = bloque[COLUMNAS].astype({col: object for col in CATEGORICAS})
+    for col in CATEGORICAS:
+        codificado[col] = codigos[col][validas]
+    return bloque, codificado.astype(float), int((~validas).sum())
+
+
+def nombres_cultivo(cult_pred, encoders):
+    """Traduce índices de cultivo a nombres; las filas infértiles quedan como 'Desconocido'."""
+    clases = np.append(encoders["cultivo"].classes_, "Desconocido")
+    return clases[np.where(cult_pred == SIN_CULTIVO, len(clases) - 1, cult_pred)]
+
+
+def construir_registros(bloque, fert_pred, cult_pred, encoders):
+    """Arma las filas de registros_pp con el mismo formato que el formulario."""
+    salida = pd.DataFrame({
+        "tipo_suelo": bloque["tipo_suelo"].astype(str),
+        **{col: bloque[col].astype(float).round(2) for col in NUMERICAS},
+        "condiciones_clima": bloque["condiciones_clima"].astype(str),
+        "mes": bloque["mes"].astype(int),
+        "fertilidad": fert_pred,
+        "cultivo": nombres_cultivo(cult_pred, encoders),
+    }, index=bloque.index)
+    for col in OPCIONALES:
+        if col in bloque.columns:
+            salida[col] = bloque[col]
+    # to_json convierte tipos de NumPy y NaN a valores serializables por Supabase
+    return json.loads(salida.to_json(orient="records", force_ascii=False))
+
+
+def _ruta_progreso(ruta):
+    return ruta + ".progreso.json"
+
+
+def _leer_progreso(ruta, huella):
+    """Filas ya insertadas en una corrida previa sobre el mismo archivo (mismo hash)."""
+    try:
+        with open(_ruta_progreso(ruta)) as f:
+            progreso = json.load(f)
+    except (OSError, ValueError):
+        return 0
+    if progreso.get("huella") != huella:
+        return 0
+    return progreso.get("filas", 0)
+
+
+def _guardar_progreso(ruta, huella, filas):
+    temporal = _ruta_progreso(ruta) + ".tmp"
+    with open(temporal, "w") as f:
+        json.dump({"filas": filas, "huella": huella}, f)
+    os.replace(temporal, _ruta_progreso(ruta))
+
+
+def ingerir(ruta, tam_bloque=5000, tam_insercion=500, reanudar=True, guardar_progreso=True,
+            insertar=None, salida=sys.stdout):
+    """Lee `ruta` por bloques, predice cada bloque en lote e inserta los resultados.
+
+    `insertar(registros, tam_lote)` permite sustituir el destino (por defecto
+    backend.database.insertar_lote, que ignora las claves ya insertadas). El
+    progreso se guarda tras cada bloque, de modo que una corrida interrumpida
+    continúa donde quedó.
+    """
+    if insertar is None:
+        from backend.database import insertar_lote as insertar
+
+    modelo_fert, modelo_cult, scaler_fert, scaler_cult, encoders = load_all_models()
+    huella = _checksum(ruta)
+    saltar = _leer_progreso(ruta, huella) if reanudar else 0
+    totales = {"filas": 0, "insertadas": 0, "descartadas": 0, "segundos": 0.0}
+
+    fila_inicial = 0
+    for n_bloque, bloque in enumerate(leer_por_bloques(ruta, tam_bloque)):
+        # El índice pasa a ser el número de fila en el archivo
+        bloque.index = pd.RangeIndex(fila_inicial, fila_inicial + len(bloque))
+        fila_inicial += len(bloque)
+        if fila_inicial <= saltar:
+            continue
+        bloque = bloque.loc[saltar:]
+        inicio = time.perf_counter()
+        validas, X, descartadas = preparar_bloque(bloque, encoders)
+        fert_pred, cult_pred = predecir_lote(X, modelo_fert, modelo_cult, scaler_fert, scaler_cult, encoders)
+        registros = construir_registros(validas, fert_pred, cult_pred, encoders)
+        for registro, n_fila in zip(registros, validas.index):
+            registro["clave_idempotencia"] = f"{huella[:16]}:{n_fila}"
+        insertadas = insertar(registros, tam_insercion) if registros else 0
+        if guardar_progreso:
+            _guardar_progreso(ruta, huella, fila_inicial)
+        segundos = time.perf_counter() - inicio
+
+        totales["filas"] += len(bloque)
+        totales["insertadas"] += insertadas
+        totales["descartadas"] += descartadas
+        totales["segundos"] += segundos
+        print(
+            f"bloque {n_bloque}: {len(bloque)} filas, {insertadas} insertadas, "
+            f"{descartadas} descartadas, {segundos:.2f} s ({len(bloque) / max(segundos, 1e-9):.0f} filas/s)",
+            file=salida,
+        )
+
+    print(
+        f"total: {totales['filas']} filas, {totales['insertadas']} insertadas, "
+        f"{totales['descartadas']} descartadas, "
+        f"{totales['filas'] / max(totales['segundos'], 1e-9):.0f} filas/s",
+        file=salida,
+    )
+    return totales
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Ingesta masiva de análisis de suelo en registros_pp.")
+    parser.add_argument("archivo", help="Archivo CSV o Parquet con las columnas del formulario")
+    parser.add_argument("--tam-bloque", type=int, default=5000, help="Filas leídas y predichas por bloque")
+    parser.add_argument("--tam-insercion", type=int, default=500, help="Filas por inserción multi-fila")
+    parser.add_argument("--reiniciar", action="store_true", help="Ignorar el progreso guardado")
+    parser.add_argument("--simular", action="store_true", help="Predecir sin insertar en la base de datos")
+    args = parser.parse_args(argv)
+
+    if args.simular:
+        ingerir(args.archivo, args.tam_bloque, args.tam_insercion, reanudar=False,
+                guardar_progreso=False, insertar=lambda registros, tam_lote: len(registros))
+    else:
+        ingerir(args.archivo, args.tam_bloque, args.tam_insercion, reanudar=not args.reiniciar)
+
+
+if __name__ == "__main__":
+    main()
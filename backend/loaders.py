@@ -1,9 +1,131 @@
+import hashlib
+import os
+import threading
+import time
+
 import joblib
 
+from backend.metricas import medido
+
+MODELS_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "models"))
+
+# Directorio de un paquete versionado (backend.paquete); si se define, sustituye a los .pkl
+PAQUETE_DIR = os.environ.get("PREDICC_PAQUETE")
+
+ARTEFACTOS = {
+    "modelo_fert": "modelo_fertilidad.pkl",
+    "modelo_cult": "modelo_cultivo.pkl",
+    "scaler_fert": "scaler_fertilidad.pkl",
+    "scaler_cult": "scaler_cultivo.pkl",
+    "encoders": "label_encoders.pkl",
+}
+
+
+def _rss_actual():
+    """Memoria residente del proceso en bytes (0 si no se puede leer)."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return 0
+
+
+def _checksum(ruta):
+    h = hashlib.sha256()
+    with open(ruta, "rb") as f:
+        for bloque in iter(lambda: f.read(1 << 20), b""):
+            h.update(bloque)
+    return h.hexdigest()
+
+
+class RegistroModelos:
+    """Registro de artefactos compartido por todas las sesiones del proceso.
+
+    Cada artefacto se carga la primera vez que se pide. En los accesos siguientes
+    solo se consulta el mtime del archivo; si cambió, se recalcula el checksum y
+    se vuelve a cargar únicamente cuando el contenido es distinto.
+    """
+
+    def __init__(self, directorio=MODELS_DIR, artefactos=ARTEFACTOS):
+        self.directorio = directorio
+        self.artefactos = dict(artefactos)
+        self._entradas = {}
+        self._lock = threading.Lock()
+
+    def _ruta(self, nombre):
+        return os.path.join(self.directorio, self.artefactos[nombre])
+
+    def obtener(self, nombre):
+        """Devuelve el artefacto `nombre`, cargándolo o recargándolo si hace falta."""
+        ruta = self._ruta(nombre)
+        mtime = os.stat(ruta).st_mtime_ns
+        entrada = self._entradas.get(nombre)
+        if entrada is not None and entrada["mtime"] == mtime:
+            return entrada["objeto"]
+
+        with self._lock:
+            entrada = self._entradas.get(nombre)
+            if entrada is not None and entrada["mtime"] == mtime:
+                return entrada["objeto"]
+            checksum = _checksum(ruta)
+            if entrada is not None and entrada["checksum"] == checksum:
+                entrada["mtime"] = mtime
+                return entrada["objeto"]
+
+            rss_antes = _rss_actual()
+            inicio = time.perf_counter()
+            objeto = joblib.load(ruta)
+            self._entradas[nombre] = {
+                "objeto": objeto,
+                "mtime": mtime,
+                "checksum": checksum,
+                "tiempo_carga_s": time.perf_counter() - inicio,
+                "memoria_bytes": max(_rss_actual() - rss_antes, 0),
+                "tamano_archivo": os.path.getsize(ruta),
+                "cargas": (entrada["cargas"] + 1) if entrada else 1,
+            }
+            return objeto
+
+    def huella(self):
+        """Identificador de la versión de los artefactos; cambia cuando se recarga cualquiera."""
+        for nombre in self.artefactos:
+            self.obtener(nombre)
+        checksums = "".join(self._entradas[nombre]["checksum"] for nombre in self.artefactos)
+        return hashlib.sha256(checksums.encode()).hexdigest()[:16]
+
+    def estadisticas(self):
+        """Tiempo de carga, memoria y checksum de cada artefacto ya cargado."""
+        return {
+            nombre: {k: v for k, v in entrada.items() if k != "objeto"}
+            for nombre, entrada in self._entradas.items()
+        }
+
+    def limpiar(self):
+        with self._lock:
+            self._entradas.clear()
+
+
+registro_modelos = RegistroModelos()
+
+
+def huella_modelos():
+    """Versión de los modelos en uso, del paquete o de los pickles."""
+    if PAQUETE_DIR:
+        from backend.paquete import obtener_paquete
+
+        return obtener_paquete(PAQUETE_DIR).huella
+    return registro_modelos.huella()
+
+
+@medido("load_all_models")
 def load_all_models():
-    modelo_fert = joblib.load("models/modelo_fertilidad.pkl")
-    modelo_cult = joblib.load("models/modelo_cultivo.pkl")
-    scaler_fert = joblib.load("models/scaler_fertilidad.pkl")
-    scaler_cult = joblib.load("models/scaler_cultivo.pkl")
-    encoders = joblib.load("models/label_encoders.pkl")
+    if PAQUETE_DIR:
+        from backend.paquete import obtener_paquete
+
+        return obtener_paquete(PAQUETE_DIR).modelos
+    modelo_fert = registro_modelos.obtener("modelo_fert")
+    modelo_cult = registro_modelos.obtener("modelo_cult")
+    scaler_fert = registro_modelos.obtener("scaler_fert")
+    scaler_cult = registro_modelos.obtener("scaler_cult")
+    encoders = registro_modelos.obtener("encoders")
     return modelo_fert, modelo_cult, scaler_fert, scaler_cult, encoders
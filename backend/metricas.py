@@ -0,0 +1,168 @@
+"""Medición de latencia por etapa.
+
+Desactivada por defecto: con PREDICC_METRICAS=1 (o `habilitar()`) cada etapa
+instrumentada alimenta un histograma, emite una línea de log JSON en el logger
+"predicc.metricas" y queda en el desglose de la última petición del hilo. Con
+PREDICC_METRICAS_PUERTO se sirve /metrics en formato de texto de Prometheus.
+
+Un hilo puede pedir solo su desglose con `iniciar_peticion(capturar=True)` sin
+tocar la medición del resto del proceso (el panel de desarrollo de la app).
+"""
+import functools
+import json
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+LIMITES = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+HABILITADO = os.environ.get("PREDICC_METRICAS", "0") == "1"
+
+logger = logging.getLogger("predicc.metricas")
+
+_histogramas = {}
+_lock = threading.Lock()
+_local = threading.local()
+_servidor = None
+
+
+def habilitar(valor=True):
+    """Activa o desactiva la medición de todo el proceso (scripts y benchmarks)."""
+    global HABILITADO
+    HABILITADO = valor
+
+
+def _activa():
+    return HABILITADO or getattr(_local, "peticion", None) is not None
+
+
+def registrar(etapa, segundos):
+    """Añade una observación al histograma de `etapa` y al desglose del hilo, si lo hay."""
+    if HABILITADO:
+        with _lock:
+            hist = _histogramas.get(etapa)
+            if hist is None:
+                hist = _histogramas[etapa] = {"cubetas": [0] * (len(LIMITES) + 1), "suma": 0.0, "cuenta": 0}
+            hist["cubetas"][bisect_left(LIMITES, segundos)] += 1
+            hist["suma"] += segundos
+            hist["cuenta"] += 1
+        if logger.isEnabledFor(logging.INFO):
+            logger.info(json.dumps({"etapa": etapa, "segundos": round(segundos, 6)}))
+    peticion = getattr(_local, "peticion", None)
+    if peticion is not None:
+        peticion[etapa] = peticion.get(etapa, 0.0) + segundos
+
+
+class _Medicion:
+    __slots__ = ("etapa", "inicio")
+
+    def __init__(self, etapa):
+        self.etapa = etapa
+
+    def __enter__(self):
+        self.inicio = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        registrar(self.etapa, time.perf_counter() - self.inicio)
+        return False
+
+
+class _Nula:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULA = _Nula()
+
+
+def medir(etapa):
+    """Context manager que mide el bloque como `etapa` (no hace nada si está desactivado)."""
+    return _Medicion(etapa) if _activa() else _NULA
+
+
+def medido(etapa):
+    """Decorador equivalente a envolver la función en `medir(etapa)`."""
+    def decorador(fn):
+        @functools.wraps(fn)
+        def envoltura(*args, **kwargs):
+            if not _activa():
+                return fn(*args, **kwargs)
+            inicio = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                registrar(etapa, time.perf_counter() - inicio)
+        return envoltura
+    return decorador
+
+
+def iniciar_peticion(capturar=False):
+    """Empieza un desglose nuevo para el hilo actual (una ejecución del script de Streamlit).
+
+    Con `capturar` el hilo mide sus etapas aunque la medición global esté desactivada;
+    sin él, solo hay desglose si lo está.
+    """
+    _local.peticion = {} if capturar or HABILITADO else None
+
+
+def ultima_peticion():
+    """Segundos por etapa acumulados desde el último `iniciar_peticion()` en este hilo."""
+    return dict(getattr(_local, "peticion", None) or {})
+
+
+def exportar_prometheus():
+    """Histogramas en formato de exposición de texto de Prometheus."""
+    lineas = [
+        "# HELP predicc_etapa_segundos Latencia por etapa de la aplicación.",
+        "# TYPE predicc_etapa_segundos histogram",
+    ]
+    with _lock:
+        for etapa, hist in sorted(_histogramas.items()):
+            acumulado = 0
+            for limite, n in zip((*LIMITES, "+Inf"), hist["cubetas"]):
+                acumulado += n
+                lineas.append(f'predicc_etapa_segundos_bucket{{etapa="{etapa}",le="{limite}"}} {acumulado}')
+            lineas.append(f'predicc_etapa_segundos_sum{{etapa="{etapa}"}} {hist["suma"]}')
+            lineas.append(f'predicc_etapa_segundos_count{{etapa="{etapa}"}} {hist["cuenta"]}')
+    return "\n".join(lineas) + "\n"
+
+
+class _ManejadorMetricas(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.rstrip("/") != "/metrics":
+            self.send_error(404)
+            return
+        cuerpo = exportar_prometheus().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(cuerpo)))
+        self.end_headers()
+        self.wfile.write(cuerpo)
+
+    def log_message(self, *args):
+        pass
+
+
+def iniciar_servidor(puerto=None, host="127.0.0.1"):
+    """Sirve /metrics en segundo plano una sola vez por proceso.
+
+    Sin `puerto` se usa PREDICC_METRICAS_PUERTO; si tampoco está definido no hace nada.
+    """
+    global _servidor
+    puerto = puerto or os.environ.get("PREDICC_METRICAS_PUERTO")
+    if _servidor is not None or not puerto:
+        return _servidor
+    with _lock:
+        if _servidor is None:
+            _servidor = ThreadingHTTPServer((host, int(puerto)), _ManejadorMetricas)
+            threading.Thread(target=_servidor.serve_forever, daemon=True).start()
+    return _servidor
@@ -0,0 +1,243 @@
+"""Paquete de modelos versionado: boosters nativos, preprocesado en .npz y manifiesto.
+
+Estructura de un paquete (un directorio):
+
+    manifiesto.json     formato, versión, variables en orden, clases y sha256 de cada archivo
+    fertilidad.ubj      XGBClassifier de fertilidad en UBJSON nativo de XGBoost
+    cultivo.ubj         XGBClassifier de cultivo
+    preprocesado.npz    medias y escalas de los scalers y clases de los encoders (sin pickle)
+
+Uso:
+
+    python -m backend.paquete convertir models/paquete     # desde los .pkl actuales
+    python -m backend.paquete verificar models/paquete
+
+Con PREDICC_PAQUETE=<directorio>, load_all_models sirve los modelos del paquete en
+lugar de los pickles.
+"""
+import argparse
+import hashlib
+import json
+import os
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+
+from backend.loaders import _checksum, _rss_actual
+from backend.predictors import VARS_CULT, VARS_FERT
+
+FORMATO = 1
+MANIFIESTO = "manifiesto.json"
+ARCHIVOS = {"modelo_fert": "fertilidad.ubj", "modelo_cult": "cultivo.ubj", "preprocesado": "preprocesado.npz"}
+CATEGORICAS = ["tipo_suelo", "condiciones_clima", "cultivo"]
+FILAS_CALENTAMIENTO = 64
+
+
+class PaqueteInvalido(ValueError):
+    """El paquete está incompleto, corrupto o no encaja con el código actual."""
+
+
+def _escala(scaler):
+    # with_mean/with_std desactivados equivalen a media 0 y escala 1
+    n = scaler.n_features_in_
+    media = scaler.mean_ if scaler.with_mean else np.zeros(n)
+    escala = scaler.scale_ if scaler.with_std else np.ones(n)
+    return np.asarray(media, dtype=np.float64), np.asarray(escala, dtype=np.float64)
+
+
+def convertir(destino, modelos=None, version=None):
+    """Escribe en `destino` el paquete equivalente a los artefactos de `modelos`.
+
+    `modelos` es la tupla de load_all_models (por defecto, los pickles de models/).
+    El manifiesto se escribe al final: un directorio sin él no es un paquete.
+    Devuelve el manifiesto.
+    """
+    if modelos is None:
+        from backend.loaders import load_all_models
+
+        modelos = load_all_models()
+    modelo_fert, modelo_cult, scaler_fert, scaler_cult, encoders = modelos
+
+    for scaler, variables in ((scaler_fert, VARS_FERT), (scaler_cult, VARS_CULT)):
+        nombres = list(getattr(scaler, "feature_names_in_", variables))
+        if nombres != variables:
+            raise PaqueteInvalido(f"El scaler espera {nombres} y el código {variables}")
+
+    os.makedirs(destino, exist_ok=True)
+    manifiesto_previo = os.path.join(destino, MANIFIESTO)
+    if os.path.exists(manifiesto_previo):
+        os.remove(manifiesto_previo)
+
+    modelo_fert.save_model(os.path.join(destino, ARCHIVOS["modelo_fert"]))
+    modelo_cult.save_model(os.path.join(destino, ARCHIVOS["modelo_cult"]))
+    media_fert, escala_fert = _escala(scaler_fert)
+    media_cult, escala_cult = _escala(scaler_cult)
+    np.savez(
+        os.path.join(destino, ARCHIVOS["preprocesado"]),
+        media_fert=media_fert, escala_fert=escala_fert,
+        media_cult=media_cult, escala_cult=escala_cult,
+        **{f"clases_{col}": np.asarray(encoders[col].classes_, dtype=str) for col in CATEGORICAS},
+    )
+
+    import sklearn
+    import xgboost as xgb
+
+    archivos = {
+        nombre: {"archivo": archivo, "sha256": _checksum(os.path.join(destino, archivo)),
+                 "bytes": os.path.getsize(os.path.join(destino, archivo))}
+        for nombre, archivo in ARCHIVOS.items()
+    }
+    manifiesto = {
+        "formato": FORMATO,
+        "version": version or hashlib.sha256(
+            "".join(a["sha256"] for a in archivos.values()).encode()).hexdigest()[:16],
+        "creado": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "generado_con": {"xgboost": xgb.__version__, "scikit-learn": sklearn.__version__, "numpy": np.__version__},
+        "variables": {"fert": VARS_FERT, "cult": VARS_CULT},
+        "clases": {col: [str(c) for c in encoders[col].classes_] for col in CATEGORICAS},
+        "archivos": archivos,
+    }
+    with open(manifiesto_previo, "w", encoding="utf-8") as f:
+        json.dump(manifiesto, f, indent=2, ensure_ascii=False)
+    return manifiesto
+
+
+def _scaler(media, escala, variables):
+    from sklearn.preprocessing import StandardScaler
+
+    scaler = StandardScaler()
+    scaler.mean_, scaler.scale_, scaler.var_ = media, escala, escala ** 2
+    scaler.n_features_in_ = len(variables)
+    scaler.feature_names_in_ = np.asarray(variables, dtype=object)
+    scaler.n_samples_seen_ = 0
+    return scaler
+
+
+def _encoder(clases):
+    from sklearn.preprocessing import LabelEncoder
+
+    encoder = LabelEncoder()
+    encoder.classes_ = np.asarray(clases, dtype=object)
+    return encoder
+
+
+class PaqueteModelos:
+    """Paquete cargado y validado; `modelos` tiene la forma de load_all_models."""
+
+    def __init__(self, ruta, calentar=True):
+        import xgboost as xgb
+
+        self.ruta = ruta
+        rss_antes = _rss_actual()
+        inicio = time.perf_counter()
+
+        ruta_manifiesto = os.path.join(ruta, MANIFIESTO)
+        if not os.path.exists(ruta_manifiesto):
+            raise PaqueteInvalido(f"No hay {MANIFIESTO} en {ruta}")
+        with open(ruta_manifiesto, "rb") as f:
+            contenido = f.read()
+        self.manifiesto = manifiesto = json.loads(contenido)
+        self.huella = hashlib.sha256(contenido).hexdigest()[:16]
+
+        if manifiesto.get("formato") != FORMATO:
+            raise PaqueteInvalido(f"Formato {manifiesto.get('formato')} no soportado (se espera {FORMATO})")
+        if manifiesto["variables"] != {"fert": VARS_FERT, "cult": VARS_CULT}:
+            raise PaqueteInvalido("El orden de variables del paquete no coincide con backend.predictors")
+        for nombre, info in manifiesto["archivos"].items():
+            ruta_archivo = os.path.join(ruta, info["archivo"])
+            if not os.path.exists(ruta_archivo) or _checksum(ruta_archivo) != info["sha256"]:
+                raise PaqueteInvalido(f"{info['archivo']} falta o no coincide con su checksum")
+
+        modelo_fert, modelo_cult = xgb.XGBClassifier(), xgb.XGBClassifier()
+        modelo_fert.load_model(os.path.join(ruta, ARCHIVOS["modelo_fert"]))
+        modelo_cult.load_model(os.path.join(ruta, ARCHIVOS["modelo_cult"]))
+        with np.load(os.path.join(ruta, ARCHIVOS["preprocesado"]), allow_pickle=False) as datos:
+            scaler_fert = _scaler(datos["media_fert"], datos["escala_fert"], VARS_FERT)
+            scaler_cult = _scaler(datos["media_cult"], datos["escala_cult"], VARS_CULT)
+            encoders = {col: _encoder(datos[f"clases_{col}"]) for col in CATEGORICAS}
+
+        for modelo, scaler, nombre in ((modelo_fert, scaler_fert, "fertilidad"), (modelo_cult, scaler_cult, "cultivo")):
+            if modelo.get_booster().num_features() != scaler.n_features_in_:
+                raise PaqueteInvalido(f"El modelo de {nombre} y su scaler tienen distinto número de variables")
+        if modelo_cult.n_classes_ != len(encoders["cultivo"].classes_):
+            raise PaqueteInvalido("El modelo de cultivo y el encoder de cultivo tienen distinto número de clases")
+        for col in CATEGORICAS:
+            if list(encoders[col].classes_) != manifiesto["clases"][col]:
+                raise PaqueteInvalido(f"Las clases de '{col}' no coinciden con el manifiesto")
+
+        self.modelos = (modelo_fert, modelo_cult, scaler_fert, scaler_cult, encoders)
+        if calentar:
+            self.calentar()
+        self.tiempo_carga_s = time.perf_counter() - inicio
+        self.memoria_bytes = max(_rss_actual() - rss_antes, 0)
+
+    def calentar(self, filas=FILAS_CALENTAMIENTO):
+        """Pasa un lote de ceros por scaler y booster para que la primera petición no pague la inicialización."""
+        modelo_fert, modelo_cult, scaler_fert, scaler_cult, _ = self.modelos
+        for modelo, scaler in ((modelo_fert, scaler_fert), (modelo_cult, scaler_cult)):
+            ceros = pd.DataFrame(np.zeros((filas, scaler.n_features_in_)), columns=scaler.feature_names_in_)
+            modelo.predict_proba(scaler.transform(ceros))
+
+    def estadisticas(self):
+        return {"version": self.manifiesto["version"], "huella": self.huella,
+                "tiempo_carga_s": self.tiempo_carga_s, "memoria_bytes": self.memoria_bytes}
+
+
+_paquetes = {}
+_lock = threading.Lock()
+
+
+def obtener_paquete(ruta):
+    """Paquete compartido del proceso; se vuelve a cargar si cambia el manifiesto."""
+    mtime = os.stat(os.path.join(ruta, MANIFIESTO)).st_mtime_ns
+    actual = _paquetes.get(ruta)
+    if actual is None or actual[0] != mtime:
+        with _lock:
+            actual = _paquetes.get(ruta)
+            if actual is None or actual[0] != mtime:
+                actual = (mtime, PaqueteModelos(ruta))
+                _paquetes[ruta] = actual
+    return actual[1]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Paquete versionado de modelos.")
+    sub = parser.add_subparsers(dest="orden", required=True)
+    p_convertir = sub.add_parser("convertir", help="Generar el paquete desde los .pkl de models/")
+    p_convertir.add_argument("destino")
+    p_convertir.add_argument("--version", help="Etiqueta de versión (por defecto, hash del contenido)")
+    p_verificar = sub.add_parser("verificar", help="Validar un paquete y compararlo con los .pkl")
+    p_verificar.add_argument("ruta")
+    args = parser.parse_args(argv)
+
+    if args.orden == "convertir":
+        manifiesto = convertir(args.destino, version=args.version)
+        print(f"Paquete {manifiesto['version']} escrito en {args.destino}")
+        return
+
+    from backend.loaders import load_all_models
+
+    try:
+        paquete = PaqueteModelos(args.ruta)
+    except PaqueteInvalido as e:
+        print(f"Paquete inválido: {e}")
+        sys.exit(1)
+    originales = load_all_models()
+    rng = np.random.default_rng(0)
+    distintas = 0
+    for i, (scaler, variables) in enumerate(((originales[2], VARS_FERT), (originales[3], VARS_CULT))):
+        X = pd.DataFrame(rng.normal(scaler.mean_, scaler.scale_ * 1.5, size=(20000, len(variables))),
+                         columns=variables)
+        ref = originales[i].predict_proba(originales[i + 2].transform(X))
+        nuevo = paquete.modelos[i].predict_proba(paquete.modelos[i + 2].transform(X))
+        distintas += int((ref != nuevo).any(axis=1).sum())
+    print(json.dumps({**paquete.estadisticas(), "filas_distintas": distintas}, indent=2))
+    sys.exit(0 if distintas == 0 else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,37 +1,172 @@
+import threading
+
+import numpy as np
 import pandas as pd
 
+from backend.cache import LRU
+from backend.metricas import medir
+
 # modules/predictors.py
-def predecir(df_input, modelo_fert, modelo_cult, scaler_fert, scaler_cult, encoders):
-    import streamlit as st
+VARS_FERT = ['pH', 'materia_organica', 'conductividad', 'nitrogeno',
+             'fosforo', 'potasio', 'densidad', 'tipo_suelo']
+
+VARS_CULT = ['mes', 'altitud', 'temperatura', 'condiciones_clima',
+             'tipo_suelo', 'pH', 'humedad', 'evapotranspiracion']
 
-    # Codificar categóricas (excepto cultivo)
+# Orden de columnas esperado cuando la entrada es un array de NumPy
+COLUMNAS = ['tipo_suelo', 'pH', 'materia_organica', 'conductividad', 'nitrogeno',
+            'fosforo', 'potasio', 'humedad', 'densidad', 'altitud', 'temperatura',
+            'condiciones_clima', 'mes', 'evapotranspiracion']
+
+SIN_CULTIVO = -1
+
+
+def codificar(df_input, encoders):
+    """Codifica las columnas categóricas (excepto cultivo) que aún sean texto."""
     for col in encoders:
         if col != "cultivo" and col in df_input.columns:
-            if df_input[col].dtype == object:
+            if not pd.api.types.is_numeric_dtype(df_input[col]):
                 try:
                     df_input[col] = encoders[col].transform(df_input[col])
                 except Exception as err:
-                    st.error(f"Error codificando '{col}': {err}")
-                    st.stop()
+                    raise ValueError(f"Error codificando '{col}': {err}") from err
+    return df_input
+
+
+def predecir_lote(X, modelo_fert, modelo_cult, scaler_fert, scaler_cult, encoders):
+    """Predice fertilidad y cultivo para N muestras en una sola pasada por modelo.
+
+    `X` puede ser un DataFrame o un array (N, len(COLUMNAS)) en el orden de COLUMNAS.
+    Devuelve dos arrays alineados: fertilidad (0/1) e índice de cultivo, con
+    SIN_CULTIVO (-1) en las filas infértiles.
+    """
+    if isinstance(X, pd.DataFrame):
+        df_input = X
+        if any(col != "cultivo" and col in X.columns and not pd.api.types.is_numeric_dtype(X[col]) for col in encoders):
+            df_input = codificar(X.copy(), encoders)
+    else:
+        df_input = pd.DataFrame(np.asarray(X).reshape(-1, len(COLUMNAS)), columns=COLUMNAS)
+
+    return predecir_ensamblado(df_input[VARS_FERT], df_input[VARS_CULT],
+                               modelo_fert, modelo_cult, scaler_fert, scaler_cult)
+
+
+def predecir_ensamblado(X_fert, X_cult, modelo_fert, modelo_cult, scaler_fert, scaler_cult):
+    """Como predecir_lote, pero con las variables ya codificadas en el orden VARS_FERT y VARS_CULT.
+
+    Acepta DataFrames o arrays (p. ej. los buffers de EnsambladorCaracteristicas).
+    """
+    if not isinstance(X_fert, pd.DataFrame):
+        X_fert = pd.DataFrame(X_fert, columns=VARS_FERT, copy=False)
+    if not isinstance(X_cult, pd.DataFrame):
+        X_cult = pd.DataFrame(X_cult, columns=VARS_CULT, copy=False)
+
+    n = len(X_fert)
+    cult_pred = np.full(n, SIN_CULTIVO, dtype=np.int64)
+    if n == 0:
+        return np.zeros(0, dtype=np.int64), cult_pred
 
     # ======== Predicción de fertilidad ========
-    vars_fert = ['pH', 'materia_organica', 'conductividad', 'nitrogeno',
-                 'fosforo', 'potasio', 'densidad', 'tipo_suelo']
-    
-    X_fert = df_input[vars_fert]
-    X_fert_scaled = scaler_fert.transform(X_fert)
-    fert_pred = modelo_fert.predict(X_fert_scaled)[0]
+    with medir("escalado"):
+        X_fert_scaled = scaler_fert.transform(X_fert)
+    with medir("xgboost"):
+        fert_pred = np.asarray(modelo_fert.predict(X_fert_scaled)).astype(np.int64)
+
+    # ======== Predicción de cultivo (solo filas fértiles) ========
+    fertiles = fert_pred != 0
+    if fertiles.any():
+        if not fertiles.all():
+            X_cult = X_cult[fertiles]
+        with medir("escalado"):
+            X_cult_scaled = scaler_cult.transform(X_cult)
+        with medir("xgboost"):
+            cult_pred[fertiles] = np.asarray(modelo_cult.predict(X_cult_scaled)).astype(np.int64)
 
-    if fert_pred == 0:
-        return fert_pred, None  # Si infértil, no predecimos cultivo
+    return fert_pred, cult_pred
 
-    # ======== Predicción de cultivo (si fértil) ========
-    vars_cult = ['mes', 'altitud', 'temperatura', 'condiciones_clima',
-                 'tipo_suelo', 'pH', 'humedad', 'evapotranspiracion']
 
-    X_cult = df_input[vars_cult]
-    X_cult_scaled = scaler_cult.transform(X_cult)
-    cult_pred_idx = int(modelo_cult.predict(X_cult_scaled)[0])  # aseguramos int
+class CachePredicciones:
+    """Memoiza predicciones por fila sobre las variables codificadas y cuantizadas.
+
+    Las entradas se redondean a `decimales` (la precisión con que se guardan los
+    registros) y las filas no cacheadas se predicen ya redondeadas, de modo que un
+    acierto devuelve exactamente lo que darían los modelos. La caché se vacía
+    cuando cambia la huella de los modelos.
+    """
+
+    def __init__(self, max_items=10000, decimales=2):
+        self.decimales = decimales
+        self._lru = LRU(max_items)
+        self._huella = None
+        self._lock = threading.Lock()
+
+    def _validar_huella(self, huella):
+        with self._lock:
+            if huella != self._huella:
+                self._lru.clear()
+                self._huella = huella
+
+    def predecir_ensamblado(self, X_fert, X_cult, modelo_fert, modelo_cult, scaler_fert, scaler_cult,
+                            huella=None):
+        """Igual que predecir_ensamblado, consultando la caché fila a fila.
+
+        Los fallos de caché (pocas filas) se predicen con el predictor compilado,
+        idéntico al pipeline y mucho más rápido para lotes pequeños.
+        """
+        if huella is None:
+            from backend.loaders import huella_modelos
+            huella = huella_modelos()
+        self._validar_huella(huella)
+
+        X_fert = np.round(np.asarray(X_fert, dtype=np.float64), self.decimales)
+        X_cult = np.round(np.asarray(X_cult, dtype=np.float64), self.decimales)
+        claves = [f.tobytes() + c.tobytes() for f, c in zip(X_fert, X_cult)]
+
+        n = len(claves)
+        fert_pred = np.empty(n, dtype=np.int64)
+        cult_pred = np.empty(n, dtype=np.int64)
+        pendientes = {}
+        for i, clave in enumerate(claves):
+            resultado = self._lru.get(clave)
+            if resultado is None:
+                pendientes.setdefault(clave, []).append(i)
+            else:
+                fert_pred[i], cult_pred[i] = resultado
+
+        if pendientes:
+            from backend.compilado import FILAS_MAX_COMPILADO, obtener_predictor_compilado
+
+            primeras = [filas[0] for filas in pendientes.values()]
+            if len(primeras) <= FILAS_MAX_COMPILADO:
+                predictor = obtener_predictor_compilado(modelo_fert, modelo_cult, scaler_fert, scaler_cult)
+                fert_nueva, cult_nueva = predictor.predecir_ensamblado(X_fert[primeras], X_cult[primeras])
+            else:
+                fert_nueva, cult_nueva = predecir_ensamblado(X_fert[primeras], X_cult[primeras], modelo_fert,
+                                                             modelo_cult, scaler_fert, scaler_cult)
+            for (clave, filas), fert, cult in zip(pendientes.items(), fert_nueva, cult_nueva):
+                self._lru.set(clave, (int(fert), int(cult)))
+                fert_pred[filas] = fert
+                cult_pred[filas] = cult
+        return fert_pred, cult_pred
+
+    def estadisticas(self):
+        return {"huella": self._huella, **self._lru.estadisticas()}
+
+
+cache_predicciones = CachePredicciones()
+
+
+def predecir(df_input, modelo_fert, modelo_cult, scaler_fert, scaler_cult, encoders):
+    import streamlit as st
+
+    try:
+        fert_pred, cult_pred = predecir_lote(df_input, modelo_fert, modelo_cult,
+                                             scaler_fert, scaler_cult, encoders)
+    except ValueError as err:
+        st.error(str(err))
+        st.stop()
 
-    return fert_pred, cult_pred_idx
+    if fert_pred[0] == 0:
+        return fert_pred[0], None  # Si infértil, no predecimos cultivo
 
+    return fert_pred[0], int(cult_pred[0])  # aseguramos int
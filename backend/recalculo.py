@@ -0,0 +1,110 @@
+"""Recalcula fertilidad y cultivo de los registros guardados tras actualizar los modelos.
+
+Uso (sin Streamlit; credenciales en SUPABASE_URL y SUPABASE_ANON_KEY):
+
+    python -m backend.recalculo --simular       # solo informe de cambios
+    python -m backend.recalculo --procesos 4    # reescribe las filas que cambian
+"""
+import argparse
+import os
+import sys
+import time
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor
+
+from backend.ingesta import nombres_cultivo, preparar_bloque
+from backend.loaders import load_all_models
+from backend.predictors import COLUMNAS, predecir_lote
+
+_modelos = None
+
+
+def _iniciar_proceso():
+    global _modelos
+    _modelos = load_all_models()
+
+
+def _predecir(X):
+    return predecir_lote(X, *_modelos)
+
+
+def diferencias(pagina, fert_pred, cultivos):
+    """Filas cuya predicción nueva difiere de la guardada."""
+    cambios = []
+    for id_reg, fert_ant, cult_ant, fert_nueva, cult_nuevo in zip(
+        pagina["id"], pagina["fertilidad"], pagina["cultivo"], fert_pred, cultivos
+    ):
+        if int(fert_ant) != int(fert_nueva) or cult_ant != cult_nuevo:
+            cambios.append({
+                "id": int(id_reg),
+                "fertilidad": int(fert_nueva),
+                "cultivo": str(cult_nuevo),
+                "cultivo_anterior": cult_ant,
+            })
+    return cambios
+
+
+def recalcular(paginas, encoders, procesos=None, simular=True, actualizar=None, tam_lote=500,
+               salida=sys.stdout):
+    """Vuelve a predecir cada página en un pool de procesos y guarda solo lo que cambió.
+
+    `paginas` es un iterable de DataFrames de registros_pp (con id, fertilidad y
+    cultivo). Con `simular=True` no se escribe nada y solo se informa cuántas
+    filas cambiarían por cada transición de cultivo.
+    """
+    if actualizar is None and not simular:
+        from backend.database import actualizar_predicciones as actualizar
+
+    procesos = procesos or os.cpu_count() or 1
+    transiciones = Counter()
+    totales = {"leidas": 0, "descartadas": 0, "cambios": 0, "actualizadas": 0}
+    inicio = time.perf_counter()
+
+    def _consumir(pagina, futuro):
+        fert_pred, cult_pred = futuro.result()
+        cambios = diferencias(pagina, fert_pred, nombres_cultivo(cult_pred, encoders))
+        transiciones.update((c["cultivo_anterior"], c["cultivo"]) for c in cambios)
+        totales["cambios"] += len(cambios)
+        if cambios and not simular:
+            totales["actualizadas"] += actualizar(cambios, tam_lote)
+
+    with ProcessPoolExecutor(max_workers=procesos, initializer=_iniciar_proceso) as pool:
+        pendientes = deque()
+        for pagina in paginas:
+            validas, X, descartadas = preparar_bloque(pagina, encoders)
+            totales["leidas"] += len(pagina)
+            totales["descartadas"] += descartadas
+            pendientes.append((validas, pool.submit(_predecir, X[COLUMNAS].to_numpy())))
+            # Ventana acotada: como mucho dos páginas en vuelo por proceso
+            while len(pendientes) >= 2 * procesos:
+                _consumir(*pendientes.popleft())
+        while pendientes:
+            _consumir(*pendientes.popleft())
+
+    segundos = time.perf_counter() - inicio
+    print(f"{'Simulación' if simular else 'Recalculo'}: {totales['leidas']} registros leídos, "
+          f"{totales['descartadas']} descartados, {totales['cambios']} con predicción distinta, "
+          f"{totales['actualizadas']} actualizados en {segundos:.1f} s", file=salida)
+    for (anterior, nuevo), n in transiciones.most_common():
+        print(f"  {anterior} -> {nuevo}: {n}", file=salida)
+    return totales, transiciones
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Recalcula las predicciones guardadas en registros_pp.")
+    parser.add_argument("--simular", action="store_true", help="Solo informar los cambios, sin escribir")
+    parser.add_argument("--procesos", type=int, default=None, help="Procesos del pool (por defecto, núcleos)")
+    parser.add_argument("--tam-pagina", type=int, default=2000, help="Registros leídos por página")
+    parser.add_argument("--tam-lote", type=int, default=500, help="Ids por update agrupado")
+    args = parser.parse_args(argv)
+
+    from backend.database import iterar_paginas
+
+    encoders = load_all_models()[-1]
+    columnas = ["id", *COLUMNAS, "fertilidad", "cultivo"]
+    recalcular(iterar_paginas(args.tam_pagina, columnas=columnas), encoders,
+               procesos=args.procesos, simular=args.simular, tam_lote=args.tam_lote)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,305 @@
+"""Servicio HTTP de predicción sin interfaz, con agrupación de peticiones.
+
+Uso:
+
+    python -m backend.servicio --puerto 8600 --max-lote 256 --espera-ms 5 --procesos 4
+
+    POST /predecir        una muestra: JSON con las variables de COLUMNAS (categóricas como texto)
+    POST /predecir/lote   {"muestras": [{...}, ...]}
+    GET  /salud           estado y estadísticas del planificador
+
+Las peticiones concurrentes que llegan dentro de `espera_ms` se juntan en una sola
+llamada vectorizada a predecir_lote de hasta `max_lote` filas. Con `procesos` > 0
+los lotes se reparten entre un pool de procesos, cada uno con los modelos cargados;
+con 0 se predicen en el propio hilo del planificador.
+"""
+import argparse
+import json
+import os
+import queue
+import signal
+import sys
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+from backend import metricas
+from backend.caracteristicas import obtener_ensamblador
+from backend.compilado import FILAS_MAX_COMPILADO, obtener_predictor_compilado
+from backend.loaders import load_all_models
+from backend.predictors import COLUMNAS, SIN_CULTIVO, predecir_lote
+
+TIEMPO_MAX_RESPUESTA = 30.0
+
+_FIN = object()
+_hilos_xgboost = None
+
+
+def _iniciar_proceso():
+    # Cada proceso del pool usa un hilo: el paralelismo lo dan los procesos
+    global _hilos_xgboost
+    _hilos_xgboost = 1
+    obtener_predictor_compilado(*load_all_models()[:4])
+
+
+def _predecir(X):
+    # load_all_models devuelve los artefactos ya cargados (y recarga si cambian en disco)
+    modelos = load_all_models()
+    if len(X) <= FILAS_MAX_COMPILADO:
+        # Micro-lotes: el predictor compilado da el mismo resultado sin DataFrame ni escalado
+        predictor = obtener_predictor_compilado(*modelos[:4])
+        if _hilos_xgboost is not None:
+            predictor.ajustar_hilos(_hilos_xgboost)
+        return predictor.predecir(X)
+    if _hilos_xgboost is not None:
+        for modelo in modelos[:2]:
+            modelo.get_booster().set_param("nthread", _hilos_xgboost)
+    return predecir_lote(X, *modelos)
+
+
+class PlanificadorLotes:
+    """Cola de peticiones que se vacía en lotes de como mucho `max_lote` filas.
+
+    Un lote se cierra al llegar a `max_lote` filas o cuando han pasado `espera_max`
+    segundos desde su primera petición. Una petición mayor que `max_lote` forma
+    su propio lote y no se parte.
+    """
+
+    def __init__(self, max_lote=256, espera_max=0.005, procesos=0):
+        self.max_lote = max_lote
+        self.espera_max = espera_max
+        self.procesos = procesos
+        self._cola = queue.Queue()
+        self._siguiente = None
+        self._pool = None
+        if procesos:
+            self._pool = ProcessPoolExecutor(max_workers=procesos, initializer=_iniciar_proceso)
+            # Arranca los procesos ya (antes de abrir el socket del servidor, que heredarían)
+            self._pool.submit(_iniciar_proceso).result()
+        else:
+            obtener_predictor_compilado(*load_all_models()[:4])  # compila antes de la primera petición
+        # Como mucho dos lotes en vuelo por proceso; el resto espera agrupándose en la cola
+        self._en_vuelo = threading.BoundedSemaphore(2 * procesos or 1)
+        self._stats = {"peticiones": 0, "filas": 0, "lotes": 0, "lote_max": 0, "errores": 0}
+        self._hilo = threading.Thread(target=self._bucle, name="planificador-lotes", daemon=True)
+        self._hilo.start()
+
+    def enviar(self, X):
+        """Encola un array (n, len(COLUMNAS)) codificado; devuelve un Future de (fertilidad, cultivo)."""
+        futuro = Future()
+        self._cola.put((X, futuro))
+        return futuro
+
+    def _recoger(self):
+        primero = self._siguiente if self._siguiente is not None else self._cola.get()
+        self._siguiente = None
+        if primero is _FIN:
+            return None
+        pendientes, filas = [primero], len(primero[0])
+        limite = time.monotonic() + self.espera_max
+        while filas < self.max_lote:
+            restante = limite - time.monotonic()
+            if restante <= 0:
+                break
+            try:
+                item = self._cola.get(timeout=restante)
+            except queue.Empty:
+                break
+            if item is _FIN or filas + len(item[0]) > self.max_lote:
+                self._siguiente = item
+                break
+            pendientes.append(item)
+            filas += len(item[0])
+        return pendientes
+
+    def _bucle(self):
+        while True:
+            pendientes = self._recoger()
+            if pendientes is None:
+                return
+            X = np.concatenate([x for x, _ in pendientes]) if len(pendientes) > 1 else pendientes[0][0]
+            self._stats["peticiones"] += len(pendientes)
+            self._stats["filas"] += len(X)
+            self._stats["lotes"] += 1
+            self._stats["lote_max"] = max(self._stats["lote_max"], len(X))
+
+            self._en_vuelo.acquire()
+            inicio = time.perf_counter()
+            if self._pool is None:
+                resultado = Future()
+                try:
+                    resultado.set_result(_predecir(X))
+                except Exception as e:
+                    resultado.set_exception(e)
+                self._repartir(pendientes, resultado, inicio)
+            else:
+                resultado = self._pool.submit(_predecir, X)
+                resultado.add_done_callback(lambda r, p=pendientes, t=inicio: self._repartir(p, r, t))
+
+    def _repartir(self, pendientes, resultado, inicio):
+        self._en_vuelo.release()
+        if metricas.HABILITADO:
+            metricas.registrar("servicio_lote", time.perf_counter() - inicio)
+        error = resultado.exception()
+        if error is not None:
+            self._stats["errores"] += 1
+            for _, futuro in pendientes:
+                futuro.set_exception(error)
+            return
+        fert, cult = resultado.result()
+        desde = 0
+        for x, futuro in pendientes:
+            futuro.set_result((fert[desde:desde + len(x)], cult[desde:desde + len(x)]))
+            desde += len(x)
+
+    def estadisticas(self):
+        lotes = self._stats["lotes"]
+        return {
+            **self._stats,
+            "lote_medio": self._stats["filas"] / lotes if lotes else None,
+            "en_cola": self._cola.qsize(),
+            "max_lote": self.max_lote,
+            "espera_max_ms": self.espera_max * 1000,
+            "procesos": self.procesos,
+        }
+
+    def detener(self):
+        self._cola.put(_FIN)
+        self._hilo.join()
+        if self._pool is not None:
+            self._pool.shutdown()
+
+
+class ServicioPrediccion:
+    """Valida y codifica las muestras JSON y las pasa al planificador."""
+
+    def __init__(self, planificador):
+        self.planificador = planificador
+
+    def codificar(self, muestras, ensamblador):
+        """Array (n, len(COLUMNAS)) y máscara de muestras con una categoría desconocida.
+
+        Se hace fila a fila con las tablas del ensamblador: para las decenas de
+        filas de una petición es más barato que construir un DataFrame. Un valor
+        que no se puede convertir a número queda en NaN e invalida solo su fila.
+        """
+        X = np.empty((len(muestras), len(COLUMNAS)))
+        desconocidos = np.zeros(len(muestras), dtype=bool)
+        for i, muestra in enumerate(muestras):
+            for j, col in enumerate(COLUMNAS):
+                valor = muestra[col]
+                try:
+                    if col in ensamblador.tablas:
+                        valor = ensamblador.codigo(col, valor)
+                        desconocidos[i] |= valor < 0
+                    X[i, j] = np.nan if valor is None else float(valor)
+                except (TypeError, ValueError):
+                    # Texto en una variable numérica o una lista/objeto en una categórica
+                    X[i, j] = np.nan
+        return X, desconocidos
+
+    def predecir(self, muestras):
+        """Una respuesta por muestra: {"fertilidad", "cultivo"} o {"error"}."""
+        faltan = [c for c in COLUMNAS if any(c not in m for m in muestras)]
+        if faltan:
+            raise ValueError(f"Faltan variables: {', '.join(faltan)}")
+        encoders = load_all_models()[-1]
+        X, desconocidos = self.codificar(muestras, obtener_ensamblador(encoders))
+        validas = ~desconocidos & np.isfinite(X).all(axis=1)
+        cultivos = encoders["cultivo"].classes_
+
+        respuestas = [{"error": "categoría desconocida"} if d else {"error": "valores vacíos, no numéricos o no finitos"}
+                      for d in desconocidos]
+        if validas.any():
+            fert, cult = self.planificador.enviar(X[validas]).result(TIEMPO_MAX_RESPUESTA)
+            for i, f, c in zip(np.flatnonzero(validas), fert, cult):
+                respuestas[i] = {"fertilidad": int(f), "cultivo": None if c == SIN_CULTIVO else str(cultivos[c])}
+        return respuestas
+
+
+class _ManejadorServicio(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # conexiones persistentes para los clientes
+    disable_nagle_algorithm = True  # cabeceras y cuerpo van en escrituras separadas
+
+    def _responder(self, estado, datos):
+        cuerpo = json.dumps(datos, ensure_ascii=False).encode()
+        self.send_response(estado)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(cuerpo)))
+        self.end_headers()
+        self.wfile.write(cuerpo)
+
+    def do_GET(self):
+        if self.path.rstrip("/") != "/salud":
+            self.send_error(404)
+            return
+        self._responder(200, {"estado": "ok", **self.server.servicio.planificador.estadisticas()})
+
+    def do_POST(self):
+        ruta = self.path.rstrip("/")
+        if ruta not in ("/predecir", "/predecir/lote"):
+            self.send_error(404)
+            return
+        try:
+            datos = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"null")
+            muestras = datos.get("muestras") if ruta == "/predecir/lote" and isinstance(datos, dict) else datos
+            if ruta == "/predecir":
+                muestras = [muestras]
+            if not isinstance(muestras, list) or not all(isinstance(m, dict) for m in muestras):
+                raise ValueError("Se esperaba un objeto JSON por muestra")
+            respuestas = self.server.servicio.predecir(muestras) if muestras else []
+        except (ValueError, TypeError) as e:
+            self._responder(400, {"error": str(e)})
+            return
+        except Exception as e:
+            self._responder(500, {"error": repr(e)})
+            return
+
+        if ruta == "/predecir":
+            self._responder(422 if "error" in respuestas[0] else 200, respuestas[0])
+        else:
+            self._responder(200, {"resultados": respuestas})
+
+    def log_message(self, *args):
+        pass
+
+
+def crear_servidor(puerto=8600, host="127.0.0.1", max_lote=256, espera_max=0.005, procesos=0):
+    """Servidor listo para `serve_forever()`; el planificador queda en `servidor.servicio`."""
+    planificador = PlanificadorLotes(max_lote, espera_max, procesos)
+    servidor = ThreadingHTTPServer((host, puerto), _ManejadorServicio)
+    servidor.daemon_threads = True
+    servidor.servicio = ServicioPrediccion(planificador)
+    return servidor
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Servicio HTTP de predicción con agrupación de peticiones.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--puerto", type=int, default=int(os.environ.get("PREDICC_SERVICIO_PUERTO", 8600)))
+    parser.add_argument("--max-lote", type=int, default=256, help="Filas máximas por llamada al modelo")
+    parser.add_argument("--espera-ms", type=float, default=5.0, help="Espera máxima para completar un lote")
+    # Por defecto se deja un núcleo para los hilos HTTP; con uno solo se predice en el planificador
+    parser.add_argument("--procesos", type=int, default=max((os.cpu_count() or 1) - 1, 0),
+                        help="Procesos que predicen (0: en el hilo del planificador)")
+    args = parser.parse_args(argv)
+
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    load_all_models()
+    servidor = crear_servidor(args.puerto, args.host, args.max_lote, args.espera_ms / 1000, args.procesos)
+    print(f"Sirviendo en http://{args.host}:{args.puerto} "
+          f"(max_lote={args.max_lote}, espera={args.espera_ms} ms, procesos={args.procesos})")
+    try:
+        servidor.serve_forever()
+    except (KeyboardInterrupt, SystemExit):
+        pass
+    finally:
+        servidor.server_close()
+        servidor.servicio.planificador.detener()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""Prueba de carga del servicio de predicción (backend.servicio).
+
+Uso:
+
+    python -m benchmarks.carga_servicio --clientes 32 --duracion 10
+    python -m benchmarks.carga_servicio --url http://127.0.0.1:8600 --lote 50
+
+Sin --url arranca el servicio en este proceso con los parámetros indicados.
+Cada cliente envía peticiones en bucle por una conexión persistente; al final
+se informa del rendimiento, la latencia p50/p95/p99/máx y el tamaño medio de
+los lotes que formó el planificador.
+"""
+import argparse
+import json
+import threading
+import time
+
+import numpy as np
+import requests
+
+from backend.loaders import load_all_models
+from benchmarks.sinteticos import generar_muestras
+
+
+def _cliente(url, cuerpos, fin, latencias, errores):
+    sesion = requests.Session()
+    i = 0
+    while time.perf_counter() < fin:
+        inicio = time.perf_counter()
+        try:
+            respuesta = sesion.post(url, data=cuerpos[i % len(cuerpos)],
+                                    headers={"Content-Type": "application/json"}, timeout=30)
+            ok = respuesta.status_code in (200, 422)
+        except requests.RequestException:
+            ok = False
+        latencias.append(time.perf_counter() - inicio)
+        if not ok:
+            errores.append(1)
+        i += 1
+
+
+def cargar(url, muestras, clientes=32, duracion=10.0, lote=1):
+    """Lanza `clientes` hilos durante `duracion` segundos y resume latencia y rendimiento."""
+    registros = json.loads(muestras.to_json(orient="records", force_ascii=False))
+    if lote == 1:
+        destino = f"{url}/predecir"
+        cuerpos = [json.dumps(r).encode() for r in registros]
+    else:
+        destino = f"{url}/predecir/lote"
+        cuerpos = [json.dumps({"muestras": registros[i:i + lote]}).encode()
+                   for i in range(0, len(registros) - lote + 1, lote)]
+
+    latencias, errores = [], []
+    fin = time.perf_counter() + duracion
+    hilos = [threading.Thread(target=_cliente, args=(destino, cuerpos[k::clientes] or cuerpos, fin, latencias, errores))
+             for k in range(clientes)]
+    inicio = time.perf_counter()
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join()
+    transcurrido = time.perf_counter() - inicio
+
+    tiempos = np.array(latencias) * 1e3
+    return {
+        "clientes": clientes,
+        "filas_por_peticion": lote,
+        "peticiones": len(tiempos),
+        "errores": len(errores),
+        "peticiones_por_s": len(tiempos) / transcurrido,
+        "filas_por_s": len(tiempos) * lote / transcurrido,
+        "p50_ms": float(np.percentile(tiempos, 50)),
+        "p95_ms": float(np.percentile(tiempos, 95)),
+        "p99_ms": float(np.percentile(tiempos, 99)),
+        "max_ms": float(tiempos.max()),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Prueba de carga del servicio de predicción.")
+    parser.add_argument("--url", help="Servicio ya en marcha; sin ella se arranca uno local")
+    parser.add_argument("--clientes", type=int, default=32)
+    parser.add_argument("--duracion", type=float, default=10.0, help="Segundos de carga")
+    parser.add_argument("--lote", type=int, default=1, help="Filas por petición (1: /predecir)")
+    parser.add_argument("--max-lote", type=int, default=256)
+    parser.add_argument("--espera-ms", type=float, default=5.0)
+    parser.add_argument("--procesos", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    modelos = load_all_models()
+    muestras = generar_muestras(10000, modelos[-1], modelos[2], modelos[3])
+
+    servidor = None
+    url = args.url
+    if url is None:
+        from backend.servicio import crear_servidor
+
+        servidor = crear_servidor(0, max_lote=args.max_lote, espera_max=args.espera_ms / 1000,
+                                  procesos=args.procesos)
+        threading.Thread(target=servidor.serve_forever, daemon=True).start()
+        url = f"http://127.0.0.1:{servidor.server_address[1]}"
+
+    try:
+        cargar(url, muestras.iloc[:500], min(args.clientes, 4), 1.0, args.lote)  # calentamiento
+        resultado = cargar(url, muestras, args.clientes, args.duracion, args.lote)
+        resultado["servicio"] = requests.get(f"{url}/salud", timeout=5).json()
+    finally:
+        if servidor is not None:
+            servidor.shutdown()
+            servidor.servicio.planificador.detener()
+    print(json.dumps(resultado, indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,238 @@
+"""Benchmarks de carga de modelos, predicción, codificación y persistencia.
+
+Uso:
+
+    python -m benchmarks.run                        # ejecuta y compara con baseline.json
+    python -m benchmarks.run --guardar-baseline     # fija los resultados como nueva referencia
+    python -m benchmarks.run --salida resultados.json --rapido
+
+Sale con código 1 si algún p50 empeora más que la tolerancia respecto a la referencia.
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from backend.almacenamiento import AlmacenamientoSQLite
+from backend.caracteristicas import obtener_ensamblador
+from backend.compilado import obtener_predictor_compilado
+from backend.loaders import load_all_models, registro_modelos
+from backend.paquete import PaqueteModelos, convertir
+from backend.predictors import predecir_lote
+from benchmarks.sinteticos import codificar_muestras, generar_muestras, registros_desde_muestras
+
+BASELINE = os.path.join(os.path.dirname(__file__), "baseline.json")
+TAMANOS_LOTE = [1, 10, 100, 1000, 10000, 100000]
+RAIZ = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+# Proceso nuevo hasta la primera predicción de ambos modelos, imports de xgboost/sklearn incluidos
+ARRANQUES = {
+    "pickles": "from backend.loaders import load_all_models; modelos = load_all_models()",
+    "paquete": "from backend.paquete import PaqueteModelos; modelos = PaqueteModelos({ruta!r}).modelos",
+}
+_HIJO = (
+    "import json, time\n"
+    "def kb(campo): return int([l for l in open('/proc/self/status') if l.startswith(campo)][0].split()[1])\n"
+    "rss_inicial = kb('VmRSS')\n"
+    "inicio = time.perf_counter()\n"
+    "{codigo}\n"
+    "import pandas as pd\n"
+    "for modelo, scaler in ((modelos[0], modelos[2]), (modelos[1], modelos[3])):\n"
+    "    modelo.predict_proba(scaler.transform(pd.DataFrame([[0.0] * scaler.n_features_in_], columns=scaler.feature_names_in_)))\n"
+    "segundos = time.perf_counter() - inicio\n"
+    # VmHWM es el pico del propio hijo; ru_maxrss hereda el del padre tras fork
+    "print(json.dumps({{'segundos': segundos, 'pico_rss_mb': kb('VmHWM') / 1024,\n"
+    "                  'incremento_rss_mb': (kb('VmHWM') - rss_inicial) / 1024}}))\n"
+)
+
+
+def _memoria_mb(campo):
+    with open("/proc/self/status") as f:
+        for linea in f:
+            if linea.startswith(campo):
+                return int(linea.split()[1]) / 1024
+    return None
+
+
+def reiniciar_pico_rss():
+    """RSS actual en MB, tras reiniciar el pico del proceso (VmHWM); None fuera de Linux.
+
+    ru_maxrss es el pico de todo el proceso y solo crece, así que dependería del
+    orden de los benchmarks; escribir 5 en /proc/self/clear_refs lo reinicia.
+    """
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return _memoria_mb("VmRSS")
+    except OSError:
+        return None
+
+
+def medir(fn, repeticiones, elementos=1, calentamiento=1):
+    """Ejecuta `fn` varias veces y resume latencia, rendimiento y memoria.
+
+    `pico_rss_mb` es el pico del proceso durante este benchmark e
+    `incremento_rss_mb`, lo que sube sobre el RSS con que empezó.
+    """
+    rss_inicial = reiniciar_pico_rss()
+    for _ in range(calentamiento):
+        fn()
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        fn()
+        tiempos.append(time.perf_counter() - inicio)
+    tiempos = np.array(tiempos)
+    pico = None if rss_inicial is None else _memoria_mb("VmHWM")
+    return {
+        "repeticiones": repeticiones,
+        "elementos": elementos,
+        "p50_ms": float(np.percentile(tiempos, 50) * 1e3),
+        "p99_ms": float(np.percentile(tiempos, 99) * 1e3),
+        "rendimiento_por_s": float(elementos * repeticiones / tiempos.sum()),
+        "pico_rss_mb": pico,
+        "incremento_rss_mb": None if pico is None else pico - rss_inicial,
+    }
+
+
+def medir_arranque(codigo, repeticiones):
+    """Como `medir`, pero cada repetición arranca un intérprete nuevo; el RSS es el del hijo."""
+    tiempos, picos, incrementos = [], [], []
+    for _ in range(repeticiones):
+        salida = subprocess.run([sys.executable, "-W", "ignore", "-c", _HIJO.format(codigo=codigo)],
+                                cwd=RAIZ, capture_output=True, text=True, check=True).stdout
+        datos = json.loads(salida.strip().splitlines()[-1])
+        tiempos.append(datos["segundos"])
+        picos.append(datos["pico_rss_mb"])
+        incrementos.append(datos["incremento_rss_mb"])
+    tiempos = np.array(tiempos)
+    return {
+        "repeticiones": repeticiones,
+        "elementos": 1,
+        "p50_ms": float(np.percentile(tiempos, 50) * 1e3),
+        "p99_ms": float(np.percentile(tiempos, 99) * 1e3),
+        "rendimiento_por_s": float(repeticiones / tiempos.sum()),
+        "pico_rss_mb": float(max(picos)),
+        "incremento_rss_mb": float(max(incrementos)),
+    }
+
+
+def ejecutar(rapido=False):
+    resultados = {}
+    reps = 5 if rapido else 20
+
+    def _carga_fria():
+        registro_modelos.limpiar()
+        load_all_models()
+
+    resultados["load_all_models_frio"] = medir(_carga_fria, max(reps // 4, 2))
+    resultados["load_all_models_caliente"] = medir(load_all_models, reps * 10)
+
+    modelos = load_all_models()
+    with tempfile.TemporaryDirectory() as tmp:
+        ruta_paquete = os.path.join(tmp, "paquete")
+        convertir(ruta_paquete, modelos)
+        # Incluye la validación de checksums y el calentamiento de ambos boosters
+        resultados["paquete_frio"] = medir(lambda: PaqueteModelos(ruta_paquete), max(reps // 4, 2))
+        for nombre, codigo in ARRANQUES.items():
+            resultados[f"arranque_{nombre}"] = medir_arranque(codigo.format(ruta=ruta_paquete), max(reps // 4, 2))
+
+    encoders = modelos[-1]
+    muestras = generar_muestras(max(TAMANOS_LOTE), encoders, modelos[2], modelos[3])
+    codificadas = codificar_muestras(muestras, encoders)
+
+    fila = codificadas.iloc[[0]]
+    resultados["predecir_fila"] = medir(lambda: predecir_lote(fila, *modelos), reps * 10)
+    for n in TAMANOS_LOTE:
+        if rapido and n > 10000:
+            continue
+        lote = codificadas.iloc[:n]
+        resultados[f"predecir_lote_{n}"] = medir(lambda: predecir_lote(lote, *modelos),
+                                                 max(reps // (1 + n // 10000), 2), elementos=n)
+
+    compilado = obtener_predictor_compilado(*modelos[:4])
+    X = np.ascontiguousarray(codificadas.to_numpy(np.float64))
+    fila_x = X[:1]
+    resultados["compilado_fila"] = medir(lambda: compilado.predecir(fila_x), reps * 10)
+    for n in TAMANOS_LOTE:
+        if rapido and n > 10000:
+            continue
+        lote_x = X[:n]
+        resultados[f"compilado_lote_{n}"] = medir(lambda: compilado.predecir(lote_x),
+                                                  max(reps // (1 + n // 10000), 2), elementos=n)
+
+    n_cod = 10000
+    resultados["codificacion_10000"] = medir(lambda: codificar_muestras(muestras.iloc[:n_cod], encoders),
+                                             reps, elementos=n_cod)
+    ensamblador = obtener_ensamblador(encoders)
+    resultados["ensamblado_10000"] = medir(lambda: ensamblador.ensamblar(muestras.iloc[:n_cod]),
+                                           reps, elementos=n_cod)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        almacenamiento = AlmacenamientoSQLite(os.path.join(tmp, "registros_pp.sqlite"))
+        registros = registros_desde_muestras(muestras.iloc[:1000])
+        it = iter(registros * (reps * 20))
+        resultados["persistencia_fila"] = medir(lambda: almacenamiento.insertar(next(it)), reps * 10)
+        resultados["persistencia_lote_1000"] = medir(lambda: almacenamiento.insertar_lote(registros, 500),
+                                                     reps, elementos=len(registros))
+
+    return {
+        "meta": {
+            "python": platform.python_version(),
+            "plataforma": platform.platform(),
+            "fecha": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "resultados": resultados,
+    }
+
+
+def comparar(actual, referencia, tolerancia):
+    """Lista de benchmarks cuyo p50 supera el de la referencia por más de `tolerancia`."""
+    regresiones = []
+    for nombre, datos in actual["resultados"].items():
+        base = referencia.get("resultados", {}).get(nombre)
+        if base and datos["p50_ms"] > base["p50_ms"] * (1 + tolerancia):
+            regresiones.append((nombre, base["p50_ms"], datos["p50_ms"]))
+    return regresiones
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks de Predicc_PP.")
+    parser.add_argument("--salida", help="Archivo JSON donde escribir los resultados")
+    parser.add_argument("--baseline", default=BASELINE, help="Referencia con la que comparar")
+    parser.add_argument("--guardar-baseline", action="store_true", help="Sobrescribir la referencia")
+    parser.add_argument("--tolerancia", type=float, default=0.5, help="Empeoramiento admitido en p50 (0.5 = 50%%)")
+    parser.add_argument("--rapido", action="store_true", help="Menos repeticiones y sin el lote de 100k")
+    args = parser.parse_args(argv)
+
+    actual = ejecutar(args.rapido)
+    texto = json.dumps(actual, indent=2, ensure_ascii=False)
+    if args.salida:
+        with open(args.salida, "w") as f:
+            f.write(texto)
+    else:
+        print(texto)
+
+    if args.guardar_baseline:
+        with open(args.baseline, "w") as f:
+            f.write(texto)
+        return 0
+
+    if not os.path.exists(args.baseline):
+        return 0
+    with open(args.baseline) as f:
+        referencia = json.load(f)
+    regresiones = comparar(actual, referencia, args.tolerancia)
+    for nombre, antes, ahora in regresiones:
+        print(f"REGRESIÓN {nombre}: p50 {antes:.3f} ms -> {ahora:.3f} ms", file=sys.stderr)
+    return 1 if regresiones else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,45 @@
+import numpy as np
+import pandas as pd
+
+from backend.predictors import COLUMNAS
+
+
+def generar_muestras(n, encoders, scaler_fert, scaler_cult, semilla=0):
+    """Genera `n` muestras con el formato del formulario (categóricas como texto).
+
+    Las categóricas salen de `classes_` de los encoders. Las numéricas se sortean
+    con la media y desviación con que se ajustaron los scalers, recortadas a cero,
+    para que los valores caigan en rangos realistas.
+    """
+    rng = np.random.default_rng(semilla)
+    estadisticos = {}
+    for scaler in (scaler_fert, scaler_cult):
+        for col, media, escala in zip(scaler.feature_names_in_, scaler.mean_, scaler.scale_):
+            estadisticos[col] = (media, escala)
+
+    datos = {}
+    for col in COLUMNAS:
+        if col in ("tipo_suelo", "condiciones_clima"):
+            datos[col] = rng.choice(encoders[col].classes_, n)
+        elif col == "mes":
+            datos[col] = rng.integers(1, 13, n)
+        else:
+            media, escala = estadisticos[col]
+            datos[col] = np.clip(rng.normal(media, escala, n), 0, None).round(2)
+    return pd.DataFrame(datos, columns=COLUMNAS)
+
+
+def codificar_muestras(muestras, encoders):
+    """Copia de `muestras` con las categóricas codificadas, lista para predecir_lote."""
+    codificadas = muestras.copy()
+    for col in ("tipo_suelo", "condiciones_clima"):
+        codificadas[col] = encoders[col].transform(codificadas[col])
+    return codificadas
+
+
+def registros_desde_muestras(muestras):
+    """Filas de registros_pp de ejemplo para medir la persistencia."""
+    filas = muestras.assign(fertilidad=1, cultivo="papa", lugar="sintético",
+                            latitud=-12.05, longitud=-77.04, prediccion=True,
+                            fecha_ingreso="2025-01-01")
+    return filas.astype(object).to_dict("records")
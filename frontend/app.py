@@ -2,13 +2,130 @@ import sys
 import os
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
 
+import numpy as np
 import streamlit as st
-import pandas as pd
 from backend.loaders import load_all_models
+from backend.barrido import barrer
 from backend.apis import get_weather, get_elevation
-from backend.predictors import predecir
+from backend.caracteristicas import obtener_ensamblador
+from backend.compilado import obtener_predictor_compilado
+from backend.predictors import cache_predicciones
 from backend.utils import cultivos as cultivo_dict
 from backend.database import guardar
+from backend import metricas
+from backend.escritura import obtener_escritor
+from backend.espacial import obtener_indice
+
+
+def cargar_indice_espacial():
+    """Índice de muestras guardadas; si el almacenamiento falla la app sigue sin él."""
+    try:
+        return obtener_indice()
+    except Exception as e:
+        st.caption(f"Índice espacial no disponible: {e}")
+        return None
+
+
+def mostrar_muestras_cercanas(lat, lon, k=5, radio_km=10.0):
+    """Muestras ya registradas más próximas a la ubicación de la predicción."""
+    indice = cargar_indice_espacial()
+    if indice is None or lat is None or lon is None:
+        return
+    with metricas.medir("muestras_cercanas"):
+        vecinos = indice.cercanos(lat, lon, k=k, radio_km=radio_km)
+    st.subheader(f"📌 Muestras cercanas (≤ {radio_km:g} km)")
+    if not vecinos:
+        st.caption("No hay muestras registradas en este radio.")
+        return
+    st.table({
+        "Distancia (km)": [round(d, 2) for d, _, _, _ in vecinos],
+        "Lugar": [datos.get("lugar") for _, _, _, datos in vecinos],
+        "Fecha": [datos.get("fecha_ingreso") for _, _, _, datos in vecinos],
+        "Fertilidad": ["Fértil" if datos.get("fertilidad") == 1 else "Infértil" for _, _, _, datos in vecinos],
+        "Cultivo": [datos.get("cultivo") for _, _, _, datos in vecinos],
+    })
+
+
+def mostrar_estado_escritura():
+    """Avisa en la barra lateral si hay registros sin guardar o apartados por error."""
+    try:
+        estado = obtener_escritor().estadisticas()
+    except Exception as e:
+        st.sidebar.error(f"❌ Cola de escritura no disponible: {e}")
+        return
+    if estado["profundidad"] and estado["fallos_seguidos"]:
+        st.sidebar.warning(f"⏳ {estado['profundidad']} registros pendientes de guardar; "
+                           f"último error: {estado['ultimo_error']}")
+    elif estado["profundidad"]:
+        st.sidebar.info(f"⏳ {estado['profundidad']} registros pendientes de guardar.")
+    if estado["apartadas"]:
+        with st.sidebar.expander(f"⚠️ {estado['apartadas']} registros rechazados"):
+            if st.button("🔁 Reintentar rechazados", key="reencolar_rechazados"):
+                st.caption(f"{obtener_escritor().reencolar()} registros devueltos a la cola.")
+            for muerta in obtener_escritor().muertas(10):
+                st.caption(muerta["error"])
+                st.json(muerta["fila"], expanded=False)
+
+
+def mostrar_panel_desarrollo():
+    """Desglose por etapa de la ejecución actual del script, en la barra lateral."""
+    desglose = metricas.ultima_peticion()
+    with st.sidebar.expander("⏱ Tiempos de la última petición", expanded=True):
+        if not desglose:
+            st.caption("Sin etapas medidas todavía.")
+            return
+        st.table({
+            "Etapa": list(desglose),
+            "ms": [round(segundos * 1000, 2) for segundos in desglose.values()],
+        })
+        st.caption(f"Total medido: {sum(desglose.values()) * 1000:.1f} ms")
+        escritura = obtener_escritor().estadisticas()
+        st.caption(f"Cola de escritura: {escritura['profundidad']} pendientes, "
+                   f"{escritura['fallos']} fallos, {escritura['apartadas']} rechazados")
+
+
+def mostrar_barrido(muestra, modelos):
+    """Calendario de siembra: la muestra actual en los 12 meses y, si se pide, en rangos de clima."""
+    import altair as alt
+
+    st.header("🗓 Calendario de siembra")
+    st.caption("Evalúa la muestra de suelo en todos los meses de una sola vez, sin pulsar Predecir mes a mes.")
+    rangos = {}
+    for variable, argumento, etiqueta, minimo, maximo in (
+        ("temperatura", "temperaturas", "Temperatura (°C)", -10.0, 45.0),
+        ("humedad", "humedades", "Humedad (%)", 0.0, 100.0),
+        ("evapotranspiracion", "evapotranspiraciones", "Evapotranspiración (mm/día)", 0.0, 15.0),
+    ):
+        if st.checkbox(f"Barrer {etiqueta.lower()}", key=f"barrer_{variable}"):
+            col1, col2 = st.columns([3, 1])
+            desde, hasta = col1.slider(etiqueta, minimo, maximo, (minimo, maximo), key=f"rango_{variable}")
+            pasos = col2.number_input("Pasos", min_value=2, max_value=100, value=10, key=f"pasos_{variable}")
+            rangos[argumento] = np.linspace(desde, hasta, int(pasos))
+    k = st.number_input("Cultivos por combinación (top-k)", min_value=1, max_value=len(modelos[-1]["cultivo"].classes_), value=3)
+    puntos = 12 * int(np.prod([len(v) for v in rangos.values()]))
+    st.caption(f"{puntos} combinaciones")
+
+    if not st.button("🧮 Calcular calendario"):
+        return
+    try:
+        resultado = barrer(muestra, modelos, k=int(k), **rangos)
+    except ValueError as e:
+        st.error(f"❌ {e}")
+        return
+
+    st.info(f"🧪 Probabilidad de suelo fértil: **{resultado['fertilidad']:.1%}**")
+    matriz = resultado["matriz"].reset_index().melt(id_vars="mes", var_name="cultivo", value_name="probabilidad")
+    st.altair_chart(
+        alt.Chart(matriz).mark_rect().encode(
+            x=alt.X("cultivo:N", title="Cultivo"),
+            y=alt.Y("mes:O", title="Mes"),
+            color=alt.Color("probabilidad:Q", scale=alt.Scale(scheme="greens")),
+            tooltip=["mes", "cultivo", alt.Tooltip("probabilidad:Q", format=".1%")],
+        ),
+        use_container_width=True,
+    )
+    with st.expander(f"Top-{int(k)} por combinación"):
+        st.dataframe(resultado["rejilla"], use_container_width=True)
 
 
 def main():
@@ -16,13 +133,20 @@ def main():
         st.set_page_config(page_title="Predicción de Fertilidad y Cultivo", layout="centered")
         st.title("🌱 Predicción de Fertilidad del Suelo y Cultivo Recomendado")
 
+        metricas.iniciar_servidor()
+        # Solo esta sesión mide su desglose; la medición global la decide PREDICC_METRICAS
+        metricas.iniciar_peticion(capturar=st.sidebar.checkbox("🛠 Panel de desarrollo", key="panel_desarrollo"))
+
         API_KEY = st.secrets["api"]["openweather_key"]
 
         if "historial" not in st.session_state:
             st.session_state["historial"] = []
 
         modelo_fert, modelo_cult, scaler_fert, scaler_cult, encoders = load_all_models()
+        # Se compila al cargar (una vez por proceso), no en el primer "Predecir"
+        obtener_predictor_compilado(modelo_fert, modelo_cult, scaler_fert, scaler_cult)
         cultivo_dict = {i: clase for i, clase in enumerate(encoders['cultivo'].classes_)}
+        ensamblador = obtener_ensamblador(encoders)
 
         st.header("📍 Ubicación")
         col1, col2 = st.columns(2)
@@ -30,6 +154,7 @@ def main():
         lon = col2.number_input("Longitud", format="%.6f")
 
         if st.button("🌤 Obtener datos climáticos"):
+            cargar_indice_espacial()  # permite reutilizar la altitud de muestras cercanas
             clima = get_weather(lat, lon, API_KEY)
             altitud = get_elevation(lat, lon)
             if clima["humedad"] is not None:
@@ -48,7 +173,7 @@ def main():
         st.header("🌾 Datos del suelo")
         tipo_suelo_opciones = list(encoders["tipo_suelo"].classes_)
         tipo_suelo_texto = st.selectbox("Tipo de suelo", tipo_suelo_opciones)
-        tipo_suelo = encoders["tipo_suelo"].transform([tipo_suelo_texto])[0]
+        tipo_suelo = ensamblador.codigo("tipo_suelo", tipo_suelo_texto)
 
         pH = st.number_input("pH", min_value=0.0, max_value=14.0, step=0.1)
         materia_organica = st.number_input("Materia orgánica (%)", min_value=0.0, step=0.1)
@@ -64,41 +189,51 @@ def main():
 
         condiciones_opciones = list(encoders["condiciones_clima"].classes_)
         condiciones_clima_texto = st.selectbox("Condiciones del clima", condiciones_opciones, index=condiciones_opciones.index(st.session_state.get("condiciones_clima_texto", condiciones_opciones[0])))
-        condiciones_clima = encoders["condiciones_clima"].transform([condiciones_clima_texto])[0]
+        condiciones_clima = ensamblador.codigo("condiciones_clima", condiciones_clima_texto)
 
         altitud = st.number_input("Altitud (m)", value=float(st.session_state.get("altitud", 0.0)))
         mes = st.selectbox("Mes de siembra", list(range(1, 13)))
         evapotranspiracion = st.number_input("Evapotranspiración (mm/día)", min_value=0.0, step=0.1)
 
+        if st.sidebar.checkbox("🗓 Calendario de siembra", key="modo_barrido"):
+            mostrar_barrido({
+                "tipo_suelo": tipo_suelo_texto, "pH": pH, "materia_organica": materia_organica,
+                "conductividad": conductividad, "nitrogeno": nitrogeno, "fosforo": fosforo,
+                "potasio": potasio, "humedad": humedad, "densidad": densidad, "altitud": altitud,
+                "temperatura": temperatura, "condiciones_clima": condiciones_clima_texto, "mes": mes,
+                "evapotranspiracion": evapotranspiracion,
+            }, (modelo_fert, modelo_cult, scaler_fert, scaler_cult, encoders))
+
         if st.button("📊 Predecir"):
-            input_data = pd.DataFrame([{
-                "tipo_suelo": tipo_suelo,
-                "pH": pH,
-                "materia_organica": materia_organica,
-                "conductividad": conductividad,
-                "nitrogeno": nitrogeno,
-                "fosforo": fosforo,
-                "potasio": potasio,
-                "humedad": humedad,
-                "densidad": densidad,
-                "altitud": altitud,
-                "temperatura": temperatura,
-                "condiciones_clima": condiciones_clima,
-                "mes": mes,
-                "evapotranspiracion": evapotranspiracion
-            }])
+            vistas, desconocido = ensamblador.ensamblar_fila(
+                tipo_suelo=tipo_suelo,
+                pH=pH,
+                materia_organica=materia_organica,
+                conductividad=conductividad,
+                nitrogeno=nitrogeno,
+                fosforo=fosforo,
+                potasio=potasio,
+                humedad=humedad,
+                densidad=densidad,
+                altitud=altitud,
+                temperatura=temperatura,
+                condiciones_clima=condiciones_clima,
+                mes=mes,
+                evapotranspiracion=evapotranspiracion
+            )
 
             st.write("tipo_suelo (input):", tipo_suelo)
             st.write("Encoder tipo_suelo classes_:", encoders['tipo_suelo'].classes_)
             st.write("condiciones_clima (input):", condiciones_clima)
             st.write("Encoder condiciones_clima classes_:", encoders['condiciones_clima'].classes_)
 
-            for col in encoders:
-                if col != 'cultivo' and col in input_data.columns:
-                    if input_data[col].dtype == object:
-                        input_data[col] = encoders[col].transform(input_data[col])
+            if desconocido:
+                st.error("❌ Tipo de suelo o condición climática desconocida para los modelos.")
+                return
 
-            fert_pred, cult_pred_idx = predecir(input_data, modelo_fert, modelo_cult, scaler_fert, scaler_cult, encoders)
+            fert_preds, cult_preds = cache_predicciones.predecir_ensamblado(vistas["fert"], vistas["cult"], modelo_fert, modelo_cult, scaler_fert, scaler_cult)
+            fert_pred = fert_preds[0]
+            cult_pred_idx = int(cult_preds[0]) if fert_pred != 0 else None
             estado_fertilidad = "FÉRTIL ✅" if fert_pred == 1 else "INFÉRTIL ❌"
             cultivo_predicho = cultivo_dict.get(cult_pred_idx, "Desconocido")
             
@@ -115,6 +250,8 @@ def main():
             else:
                 st.warning("⚠️ No se recomienda sembrar. Mejore las condiciones del suelo.")
 
+            mostrar_muestras_cercanas(st.session_state.get("lat"), st.session_state.get("lon"))
+
             registro = {
                 "tipo_suelo": tipo_suelo_texto,
                 "pH": round(pH, 2),
@@ -143,6 +280,11 @@ def main():
     except Exception as e:
         st.error(f"❌ Error en la app: {e}")
 
+    finally:
+        mostrar_estado_escritura()
+        if st.session_state.get("panel_desarrollo"):
+            mostrar_panel_desarrollo()
+
 if __name__ == "__main__":
     main()
 
@@ -4,9 +4,10 @@ sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".
 
 import streamlit as st
 import pandas as pd
-from backend.database import obtener_registros, eliminar_registro, actualizar_registro
+from backend.database import obtener_pagina, eliminar_registro, actualizar_registro
 from backend.loaders import load_all_models
-from backend.predictors import predecir
+from backend.caracteristicas import obtener_ensamblador
+from backend.predictors import cache_predicciones
 from backend.utils import cultivos as cultivo_dict
 from datetime import datetime
 import pytz
@@ -14,8 +15,42 @@ import pytz
 st.set_page_config(page_title="Gestor de Registros", layout="wide")
 st.title("📋 Gestor de Registros de Predicción")
 
-# Cargar registros desde Supabase
-registros = obtener_registros()
+# Filtros aplicados en el servidor
+with st.sidebar:
+    st.header("🔎 Filtros")
+    tam_pagina = st.selectbox("Registros por página", [25, 50, 100, 200], index=1)
+    usar_fechas = st.checkbox("Filtrar por fecha de ingreso")
+    desde, hasta = (st.date_input("Desde"), st.date_input("Hasta")) if usar_fechas else (None, None)
+    cultivos_opciones = ["Todos", *load_all_models()[-1]["cultivo"].classes_, "Desconocido"]
+    cultivo_opcion = st.selectbox("Cultivo", cultivos_opciones)
+    cultivo_filtro = None if cultivo_opcion == "Todos" else cultivo_opcion
+    fert_opcion = st.selectbox("Fertilidad", ["Todas", "Fértil", "Infértil"])
+    fertilidad_filtro = {"Todas": None, "Fértil": 1, "Infértil": 0}[fert_opcion]
+
+filtros = {"desde": desde, "hasta": hasta, "cultivo": cultivo_filtro, "fertilidad": fertilidad_filtro}
+
+# Reiniciar la paginación cuando cambian los filtros
+if st.session_state.get("filtros_gestor") != (filtros, tam_pagina):
+    st.session_state["filtros_gestor"] = (filtros, tam_pagina)
+    st.session_state["cursores"] = [None]
+
+cursores = st.session_state["cursores"]
+
+# Cargar solo la página visible desde Supabase
+try:
+    registros, siguiente_id = obtener_pagina(tam_pagina, cursores[-1], **filtros)
+except Exception as e:
+    st.error(f"❌ Error al obtener registros: {e}")
+    st.stop()
+
+# La navegación va antes de comprobar si la página está vacía, para poder volver atrás
+col_ant, col_sig = st.columns(2)
+if col_ant.button("⬅️ Anterior", disabled=len(cursores) == 1):
+    cursores.pop()
+    st.rerun()
+if col_sig.button("Siguiente ➡️", disabled=siguiente_id is None):
+    cursores.append(siguiente_id)
+    st.rerun()
 
 if registros.empty:
     st.info("No hay registros disponibles.")
@@ -26,7 +61,7 @@ df["id"] = df["id"].astype(int)
 df = df.sort_values(by="id", ascending=True)
 
 # Mostrar tabla
-with st.expander("📑 Ver todos los registros", expanded=True):
+with st.expander(f"📑 Registros (página {len(cursores)})", expanded=True):
     st.dataframe(df, use_container_width=True)
 
 # Selección de registro por ID
@@ -101,16 +136,14 @@ with st.expander("✏️ Editar registro", expanded=True):
         if not cambios:
             st.info("ℹ️ No se detectaron cambios. El registro no fue actualizado.")
         else:
-            tipo_suelo = encoders["tipo_suelo"].transform([nuevos_valores["tipo_suelo"]])[0]
-            condiciones_clima = encoders["condiciones_clima"].transform([nuevos_valores["condiciones_clima"]])[0]
-
-            input_df = pd.DataFrame([{
-                **nuevos_valores,
-                "tipo_suelo": tipo_suelo,
-                "condiciones_clima": condiciones_clima
-            }])
-
-            fert_pred, cult_pred_idx = predecir(input_df, modelo_fert, modelo_cult, scaler_fert, scaler_cult, encoders)
+            vistas, desconocido = obtener_ensamblador(encoders).ensamblar_fila(**nuevos_valores)
+            if desconocido:
+                st.error("❌ Tipo de suelo o condición climática desconocida para los modelos.")
+                st.stop()
+
+            fert_preds, cult_preds = cache_predicciones.predecir_ensamblado(vistas["fert"], vistas["cult"], modelo_fert, modelo_cult, scaler_fert, scaler_cult)
+            fert_pred = fert_preds[0]
+            cult_pred_idx = int(cult_preds[0]) if fert_pred != 0 else None
             cultivo_pred = cultivo_dict.get(cult_pred_idx, "Desconocido")
 
             fert_actual = registro_sel["fertilidad"]
@@ -0,0 +1,47 @@
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+import streamlit as st
+from backend.agregados import obtener_agregados
+from backend.database import iterar_paginas
+
+st.set_page_config(page_title="Panel de Resumen", layout="wide")
+st.title("📊 Panel de Resumen de Registros")
+
+# Los resúmenes se mantienen al guardar/editar/eliminar: no se recorre registros_pp
+agregados = obtener_agregados()
+
+fert_suelo = agregados.fertilidad_por_suelo()
+if fert_suelo.empty:
+    st.info("Aún no hay resúmenes. Si ya existen registros, reconstrúyelos desde la barra lateral.")
+
+with st.sidebar:
+    st.header("🔧 Mantenimiento")
+    if st.button("♻️ Reconstruir resúmenes"):
+        with st.spinner("Recorriendo registros_pp..."):
+            total = agregados.reconstruir(iterar_paginas(2000))
+        st.success(f"✅ Resúmenes reconstruidos a partir de {total} registros.")
+        st.rerun()
+
+col1, col2 = st.columns(2)
+col1.metric("Registros", int(fert_suelo["registros"].sum()) if not fert_suelo.empty else 0)
+if not fert_suelo.empty:
+    tasa_global = (fert_suelo["tasa_fertilidad"] * fert_suelo["registros"]).sum() / fert_suelo["registros"].sum()
+    col2.metric("Tasa de fertilidad", f"{tasa_global:.1%}")
+
+st.subheader("🧪 Fertilidad por tipo de suelo")
+if not fert_suelo.empty:
+    st.dataframe(fert_suelo.style.format({"tasa_fertilidad": "{:.1%}"}), use_container_width=True)
+    st.bar_chart(fert_suelo.set_index("tipo_suelo")["tasa_fertilidad"])
+
+st.subheader("🌾 Cultivos recomendados por mes")
+cultivos_mes = agregados.cultivos_por_mes()
+if not cultivos_mes.empty:
+    st.bar_chart(cultivos_mes)
+    st.dataframe(cultivos_mes, use_container_width=True)
+
+st.subheader("⚗️ pH y NPK por cultivo")
+nutrientes = agregados.nutrientes_por_cultivo()
+if not nutrientes.empty:
+    st.dataframe(nutrientes.round(2), use_container_width=True)
@@ -0,0 +1,8 @@
+-- Clave de idempotencia para la escritura diferida (backend.escritura).
+-- Cada registro encolado lleva un uuid; reenviar un lote tras un fallo
+-- parcial no duplica filas gracias a la restricción UNIQUE.
+alter table public.registros_pp
+    add column if not exists clave_idempotencia text;
+
+create unique index if not exists registros_pp_clave_idempotencia_key
+    on public.registros_pp (clave_idempotencia);
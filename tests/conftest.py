@@ -0,0 +1,12 @@
+import pytest
+
+from backend import agregados, almacenamiento
+
+
+@pytest.fixture
+def almacenamiento_local(tmp_path, monkeypatch):
+    """registros_pp y sus agregados en SQLite dentro de tmp_path, como backends del proceso."""
+    local = almacenamiento.AlmacenamientoSQLite(str(tmp_path / "registros_pp.sqlite"))
+    monkeypatch.setattr(almacenamiento, "_almacenamiento", local)
+    monkeypatch.setattr(agregados, "_agregados", agregados.Agregados(str(tmp_path / "agregados.sqlite")))
+    return local
@@ -0,0 +1,39 @@
+from backend import almacenamiento
+from backend.agregados import obtener_agregados
+from backend.database import actualizar_predicciones, insertar_lote
+
+
+class AlmacenamientoConRLS(almacenamiento.AlmacenamientoSQLite):
+    """Como Supabase con una política que no deja modificar filas: no falla, devuelve []."""
+
+    def actualizar_ids(self, ids, datos):
+        return []
+
+    def eliminar(self, id_registro):
+        return []
+
+
+def registro(mes, cultivo):
+    return {"tipo_suelo": "franco", "mes": mes, "fertilidad": 1, "cultivo": cultivo, "pH": 6.5}
+
+
+def test_recalculo_rechazado_no_toca_los_agregados(almacenamiento_local, monkeypatch):
+    insertar_lote([registro(3, "papa"), registro(3, "papa")])
+    ids = [f["id"] for f in almacenamiento_local.seleccionar(["id"])]
+    antes = obtener_agregados().cultivos_por_mes()
+
+    con_rls = AlmacenamientoConRLS(almacenamiento_local.ruta)
+    monkeypatch.setattr(almacenamiento, "_almacenamiento", con_rls)
+    assert actualizar_predicciones([{"id": i, "fertilidad": 1, "cultivo": "maiz"} for i in ids]) == 0
+    assert obtener_agregados().cultivos_por_mes().equals(antes)
+
+    monkeypatch.setattr(almacenamiento, "_almacenamiento", almacenamiento_local)
+    assert actualizar_predicciones([{"id": ids[0], "fertilidad": 1, "cultivo": "maiz"}]) == 1
+    assert obtener_agregados().cultivos_por_mes().loc[3].to_dict() == {"maiz": 1, "papa": 1}
+
+
+def test_eliminar_devuelve_solo_lo_borrado(almacenamiento_local):
+    insertar_lote([registro(5, "papa")])
+    (fila,) = almacenamiento_local.seleccionar()
+    assert [f["id"] for f in almacenamiento_local.eliminar(fila["id"])] == [fila["id"]]
+    assert almacenamiento_local.eliminar(fila["id"]) == []
@@ -0,0 +1,151 @@
+import json
+import threading
+import time
+import types
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from backend import apis, cache
+from backend.cache import CacheTTL
+
+
+class ServidorFalso:
+    """Servidor HTTP local que responde en orden lo que haya en `respuestas`.
+
+    Cada respuesta es (estado, cuerpo) o (estado, cuerpo, demora_s); cuando se
+    agotan se repite la última. `peticiones` guarda la ruta de cada llamada.
+    """
+
+    def __init__(self):
+        self.respuestas = []
+        self.peticiones = []
+        servidor = self
+
+        class Manejador(BaseHTTPRequestHandler):
+            def _responder(self):
+                servidor.peticiones.append(self.path)
+                estado, cuerpo, *demora = servidor.respuestas.pop(0) if len(servidor.respuestas) > 1 \
+                    else servidor.respuestas[0]
+                if demora:
+                    time.sleep(demora[0])
+                datos = json.dumps(cuerpo).encode()
+                try:
+                    self.send_response(estado)
+                    self.send_header("Content-Type", "application/json")
+                    self.send_header("Content-Length", str(len(datos)))
+                    self.end_headers()
+                    self.wfile.write(datos)
+                except OSError:
+                    pass  # el cliente ya cortó por timeout
+
+            def do_GET(self):
+                self._responder()
+
+            def do_POST(self):
+                self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                self._responder()
+
+            def log_message(self, *args):
+                pass
+
+        self._http = ThreadingHTTPServer(("127.0.0.1", 0), Manejador)
+        self.url = f"http://127.0.0.1:{self._http.server_port}"
+        self._hilo = threading.Thread(target=self._http.serve_forever, daemon=True)
+        self._hilo.start()
+
+    def cerrar(self):
+        self._http.shutdown()
+        self._http.server_close()
+
+
+@pytest.fixture
+def servidor(tmp_path, monkeypatch):
+    falso = ServidorFalso()
+    ruta = str(tmp_path / "cache.sqlite")
+    monkeypatch.setattr(apis, "ELEVATION_URL", falso.url + "/elevacion")
+    monkeypatch.setattr(apis, "WEATHER_URL", falso.url + "/clima")
+    monkeypatch.setattr(apis, "TIMEOUT", (1, 0.3))
+    monkeypatch.setattr(apis, "session", apis._crear_sesion())
+    monkeypatch.setattr(apis, "cache_elevacion", CacheTTL("elevacion", ttl=None, ruta_db=ruta))
+    monkeypatch.setattr(apis, "cache_clima", CacheTTL("clima", ttl=30 * 60, ruta_db=ruta))
+    yield falso
+    falso.cerrar()
+
+
+@pytest.fixture
+def reloj(monkeypatch):
+    """Hora de la caché controlada por el test."""
+    ahora = [time.time()]
+    monkeypatch.setattr(cache, "time", types.SimpleNamespace(time=lambda: ahora[0]))
+    return ahora
+
+
+def elevacion(metros):
+    return 200, {"results": [{"elevation": metros}]}
+
+
+def clima(humedad, temperatura, nombre="Lima"):
+    return 200, {"main": {"humidity": humedad, "temp": temperatura}, "name": nombre}
+
+
+def test_acierto_de_cache_no_consulta_la_api(servidor):
+    servidor.respuestas = [elevacion(154.0)]
+
+    assert apis.get_elevation(-12.04, -77.03) == 154.0
+    assert apis.get_elevation(-12.04001, -77.03001) == 154.0  # misma celda de ~11 m
+    assert len(servidor.peticiones) == 1
+
+
+def test_clima_caduca_y_la_altitud_no(servidor, reloj):
+    servidor.respuestas = [clima(80, 18.5)]
+    assert apis.get_weather(-12.04, -77.03, "clave")["temperatura"] == 18.5
+
+    reloj[0] += 29 * 60
+    assert apis.get_weather(-12.04, -77.03, "clave")["temperatura"] == 18.5
+    assert len(servidor.peticiones) == 1
+
+    servidor.respuestas = [clima(75, 20.0)]
+    reloj[0] += 2 * 60
+    assert apis.get_weather(-12.04, -77.03, "clave")["temperatura"] == 20.0
+    assert len(servidor.peticiones) == 2
+
+    servidor.respuestas = [elevacion(154.0)]
+    assert apis.get_elevation(-12.04, -77.03) == 154.0
+    reloj[0] += 10 * 365 * 24 * 3600
+    assert apis.get_elevation(-12.04, -77.03) == 154.0
+    assert len(servidor.peticiones) == 3
+
+
+def test_consultas_fallidas_no_se_guardan(servidor):
+    servidor.respuestas = [(404, {"error": "sin datos"})]
+    assert apis.get_elevation(-12.04, -77.03) is None
+    assert apis.get_weather(-12.04, -77.03, "clave") == {"humedad": None, "temperatura": None, "ubicacion": ""}
+    assert apis.get_elevations([(-12.04, -77.03)]) == [None]
+
+    servidor.respuestas = [elevacion(154.0)]
+    assert apis.get_elevation(-12.04, -77.03) == 154.0
+    servidor.respuestas = [clima(80, 18.5)]
+    assert apis.get_weather(-12.04, -77.03, "clave")["humedad"] == 80
+    assert len(servidor.peticiones) == 5
+
+
+def test_reintenta_errores_temporales_y_timeouts(servidor):
+    servidor.respuestas = [(503, {}), elevacion(154.0)]
+    assert apis.get_elevation(-12.04, -77.03) == 154.0
+    assert len(servidor.peticiones) == 2
+
+    # La primera respuesta tarda más que el timeout de lectura y se reintenta
+    servidor.respuestas = [(*elevacion(3000.0), 1.0), elevacion(3001.0)]
+    inicio = time.monotonic()
+    assert apis.get_elevation(-13.5, -71.9) == 3001.0
+    assert time.monotonic() - inicio < 1.0
+    assert len(servidor.peticiones) == 4
+
+
+def test_altitudes_por_lote_en_una_sola_peticion(servidor):
+    servidor.respuestas = [(200, {"results": [{"elevation": 10.0}, {"elevation": 20.0}]})]
+
+    assert apis.get_elevations([(-12.0, -77.0), (-13.0, -76.0), (-12.0, -77.0)]) == [10.0, 20.0, 10.0]
+    assert apis.get_elevations([(-13.0, -76.0)]) == [20.0]
+    assert len(servidor.peticiones) == 1
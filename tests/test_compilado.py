@@ -0,0 +1,50 @@
+import numpy as np
+import pytest
+
+from backend.compilado import obtener_predictor_compilado
+from backend.loaders import load_all_models
+from backend.predictors import COLUMNAS, VARS_CULT, VARS_FERT, CachePredicciones, predecir_lote
+from backend.servicio import PlanificadorLotes, ServicioPrediccion
+from benchmarks.sinteticos import codificar_muestras, generar_muestras
+
+
+@pytest.fixture(scope="module")
+def modelos():
+    return load_all_models()
+
+
+@pytest.fixture(scope="module")
+def muestras(modelos):
+    return generar_muestras(300, modelos[-1], modelos[2], modelos[3])
+
+
+@pytest.fixture(scope="module")
+def X(modelos, muestras):
+    # Valores con 2 decimales, como los del formulario y registros_pp
+    return np.round(codificar_muestras(muestras, modelos[-1])[COLUMNAS].to_numpy(np.float64), 2)
+
+
+def test_compilado_coincide_en_float64_y_float32(modelos, X):
+    predictor = obtener_predictor_compilado(*modelos[:4])
+    referencia = predecir_lote(X, *modelos)
+    np.testing.assert_array_equal(predictor.predecir(X), referencia)
+
+    X32 = X.astype(np.float32)
+    np.testing.assert_array_equal(predictor.predecir(X32), predecir_lote(X32.astype(np.float64), *modelos))
+
+
+def test_cache_de_la_app_usa_el_compilado_sin_cambiar_resultados(modelos, X):
+    fert = X[:, [COLUMNAS.index(v) for v in VARS_FERT]]
+    cult = X[:, [COLUMNAS.index(v) for v in VARS_CULT]]
+    resultado = CachePredicciones().predecir_ensamblado(fert, cult, *modelos[:4], huella="prueba")
+    np.testing.assert_array_equal(resultado, predecir_lote(X, *modelos))
+
+
+def test_servicio_predice_como_predecir_lote(modelos, muestras, X):
+    planificador = PlanificadorLotes(max_lote=64, espera_max=0.001)
+    try:
+        respuestas = ServicioPrediccion(planificador).predecir(muestras.to_dict("records"))
+    finally:
+        planificador.detener()
+    fert, cult = predecir_lote(X, *modelos)
+    assert [r["fertilidad"] for r in respuestas] == fert.tolist()
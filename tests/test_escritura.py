@@ -0,0 +1,142 @@
+import pytest
+
+from backend.almacenamiento import AlmacenamientoSQLite, AlmacenamientoSupabase, FaltaMigracion
+from backend.escritura import EscritorDiferido
+
+
+class AlmacenamientoIntermitente:
+    """Envoltura que falla con un error de red las primeras `fallos` llamadas."""
+
+    def __init__(self, almacenamiento, fallos):
+        self.almacenamiento = almacenamiento
+        self.fallos = fallos
+
+    def insertar_lote_idempotente(self, filas, columna="clave_idempotencia"):
+        if self.fallos:
+            self.fallos -= 1
+            raise ConnectionError("sin red")
+        return self.almacenamiento.insertar_lote_idempotente(filas, columna)
+
+
+@pytest.fixture
+def almacenamiento(tmp_path):
+    return AlmacenamientoSQLite(str(tmp_path / "registros_pp.sqlite"))
+
+
+@pytest.fixture
+def escritor(tmp_path, almacenamiento, monkeypatch):
+    # Sin hilo de fondo: las pruebas vuelcan a mano
+    monkeypatch.setattr(EscritorDiferido, "iniciar", lambda self: None)
+    return EscritorDiferido(str(tmp_path / "spool.sqlite"), almacenamiento)
+
+
+def fila(**extra):
+    return {"tipo_suelo": "franco", "pH": 6.5, "fertilidad": 1, "cultivo": "papa", **extra}
+
+
+def test_fila_rechazada_se_aparta_y_no_bloquea_las_siguientes(escritor, almacenamiento):
+    escritor.encolar(fila(columna_inexistente=1))
+    escritor.encolar(fila())
+
+    assert escritor.vaciar() == 2
+    assert escritor.profundidad() == 0
+    assert len(almacenamiento.seleccionar()) == 1
+    muertas = escritor.muertas()
+    assert len(muertas) == 1 and "columna_inexistente" in muertas[0]["error"]
+    assert escritor.estadisticas()["apartadas"] == 1
+
+
+def test_reenviar_una_clave_no_duplica(escritor, almacenamiento):
+    escritor.encolar(fila(clave_idempotencia="k1"))
+    escritor.vaciar()
+    escritor.encolar(fila(clave_idempotencia="k1"))
+    escritor.vaciar()
+
+    assert len(almacenamiento.seleccionar()) == 1
+
+
+def test_error_transitorio_deja_el_lote_en_el_spool(tmp_path, almacenamiento, monkeypatch):
+    monkeypatch.setattr(EscritorDiferido, "iniciar", lambda self: None)
+    escritor = EscritorDiferido(str(tmp_path / "spool.sqlite"), AlmacenamientoIntermitente(almacenamiento, 1))
+    escritor.encolar(fila())
+
+    with pytest.raises(ConnectionError):
+        escritor.volcar_lote()
+    assert escritor.profundidad() == 1
+    assert escritor.muertas() == []
+
+    assert escritor.vaciar() == 1
+    assert len(almacenamiento.seleccionar()) == 1
+
+
+def test_al_volcar_recibe_solo_las_filas_insertadas(tmp_path, almacenamiento, monkeypatch):
+    monkeypatch.setattr(EscritorDiferido, "iniciar", lambda self: None)
+    recibidas = []
+    escritor = EscritorDiferido(str(tmp_path / "spool.sqlite"), almacenamiento, al_volcar=recibidas.extend)
+    escritor.encolar(fila(clave_idempotencia="k1"))
+    escritor.vaciar()
+    escritor.encolar(fila(clave_idempotencia="k1"))
+    escritor.encolar(fila(clave_idempotencia="k2"))
+    escritor.vaciar()
+
+    assert [f["clave_idempotencia"] for f in recibidas] == ["k1", "k2"]
+    assert all(f["id"] is not None for f in recibidas)
+
+
+class ErrorAPI(Exception):
+    """Como postgrest.APIError: el código de Postgres/PostgREST va en `code`."""
+
+    def __init__(self, code):
+        super().__init__(f"error {code}")
+        self.code = code
+
+
+class AlmacenamientoQueFalla:
+    def __init__(self, error):
+        self.error = error
+
+    def insertar_lote_idempotente(self, filas, columna="clave_idempotencia"):
+        raise self.error
+
+
+@pytest.mark.parametrize("error", [ErrorAPI("42501"), ErrorAPI("PGRST301"),
+                                   FaltaMigracion("falta clave_idempotencia")])
+def test_permisos_credenciales_y_migracion_no_apartan_filas(tmp_path, monkeypatch, error):
+    monkeypatch.setattr(EscritorDiferido, "iniciar", lambda self: None)
+    escritor = EscritorDiferido(str(tmp_path / "spool.sqlite"), AlmacenamientoQueFalla(error))
+    escritor.encolar(fila())
+    escritor.encolar(fila())
+
+    with pytest.raises(type(error)):
+        escritor.volcar_lote()
+    assert escritor.profundidad() == 2
+    assert escritor.muertas() == []
+
+
+def test_reencolar_devuelve_las_filas_apartadas_a_la_cola(escritor, almacenamiento):
+    clave = escritor.encolar(fila(columna_inexistente=1))
+    escritor.vaciar()
+    assert escritor.profundidad() == 0
+
+    assert escritor.reencolar([clave]) == 1
+    assert escritor.muertas() == [] and escritor.profundidad() == 1
+
+
+def test_supabase_sin_migracion_no_inserta_sin_clave():
+    class Tabla:
+        insertadas = []
+
+        def upsert(self, filas, **kwargs):
+            raise ErrorAPI("42P10")
+
+        def insert(self, filas):
+            self.insertadas.extend(filas)
+            return self
+
+    supabase = AlmacenamientoSupabase(url="http://localhost", key="x")
+    tabla = Tabla()
+    supabase._tabla = lambda: tabla
+
+    with pytest.raises(FaltaMigracion):
+        supabase.insertar_lote_idempotente([fila(clave_idempotencia="k1")])
+    assert tabla.insertadas == []
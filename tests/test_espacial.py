@@ -0,0 +1,73 @@
+import pytest
+
+from backend import almacenamiento, espacial
+from backend.database import actualizar_predicciones, insertar_lote, registrar_inserciones
+from backend.escritura import EscritorDiferido
+
+
+@pytest.fixture
+def indice(almacenamiento_local, monkeypatch):
+    monkeypatch.setattr(espacial, "_indice", espacial.IndiceEspacial())
+    return espacial.indice_si_existe()
+
+
+def muestra(lat, lon, **extra):
+    return {"latitud": lat, "longitud": lon, "altitud": 150.0, "cultivo": "papa", "fertilidad": 1, **extra}
+
+
+def test_filas_insertadas_por_lote_se_pueden_borrar_y_editar(indice):
+    insertar_lote([muestra(-12.0, -77.0), muestra(-12.01, -77.0)])
+    ids = sorted(d["id"] for *_, d in indice.cercanos(-12.0, -77.0, k=10, radio_km=5))
+    assert len(ids) == 2 and None not in ids
+
+    indice.eliminar_id(ids[0])
+    editada = almacenamiento.obtener_almacenamiento().actualizar(ids[1], {"latitud": -12.5})
+    indice.agregar_filas(editada)
+
+    assert indice.cercanos(-12.0, -77.0, k=10, radio_km=5) == []
+    assert len(indice) == 1
+
+
+def test_filas_del_spool_llegan_con_id(indice, tmp_path, monkeypatch):
+    monkeypatch.setattr(EscritorDiferido, "iniciar", lambda self: None)
+    escritor = EscritorDiferido(str(tmp_path / "spool.sqlite"), almacenamiento.obtener_almacenamiento(),
+                                al_volcar=registrar_inserciones)
+    escritor.encolar(muestra(-12.0, -77.0))
+    escritor.vaciar()
+
+    (_, _, _, datos), = indice.cercanos(-12.0, -77.0)
+    indice.eliminar_id(datos["id"])
+    assert indice.cercanos(-12.0, -77.0) == []
+    assert indice.altitud_cercana(-12.0, -77.0) is None
+
+
+def test_altitud_cercana_ignora_altitudes_vacias_o_en_cero(indice):
+    indice.agregar_filas([
+        {"id": 1, **muestra(-12.0, -77.0, altitud=0.0)},
+        {"id": 2, **muestra(-12.0, -77.0001, altitud=None)},
+        {"id": 3, **muestra(-12.0, -77.0002, altitud="sin dato")},
+    ])
+    assert indice.altitud_cercana(-12.0, -77.0) is None
+
+    indice.agregar_filas([{"id": 4, **muestra(-12.0, -77.0003, altitud="320.5")}])
+    assert indice.altitud_cercana(-12.0, -77.0) == 320.5
+
+
+def test_altitud_del_indice_no_se_guarda_en_la_cache_permanente(indice, tmp_path, monkeypatch):
+    from backend import apis
+    from backend.cache import CacheTTL
+
+    monkeypatch.setattr(apis, "cache_elevacion", CacheTTL("elevacion", ttl=None, ruta_db=str(tmp_path / "cache.sqlite")))
+    indice.agregar_filas([{"id": 1, **muestra(-12.0, -77.0)}])
+
+    assert apis.get_elevation(-12.0, -77.0) == 150.0
+    assert apis.cache_elevacion.get(apis._clave(-12.0, -77.0, apis.DECIMALES_ELEVACION)) is None
+
+
+def test_actualizar_predicciones_refresca_el_indice(indice):
+    insertar_lote([muestra(-12.0, -77.0)])
+    (_, _, _, datos), = indice.cercanos(-12.0, -77.0)
+
+    assert actualizar_predicciones([{"id": datos["id"], "fertilidad": 0, "cultivo": "maiz"}]) == 1
+    (_, _, _, datos), = indice.cercanos(-12.0, -77.0)
+    assert (datos["cultivo"], datos["fertilidad"]) == ("maiz", 0)
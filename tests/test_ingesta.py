@@ -0,0 +1,38 @@
+import io
+
+import pytest
+
+from backend import ingesta
+from backend.database import insertar_lote
+from backend.loaders import load_all_models
+from benchmarks.sinteticos import generar_muestras
+
+
+@pytest.fixture
+def archivo(tmp_path):
+    modelos = load_all_models()
+    ruta = str(tmp_path / "analisis.csv")
+    generar_muestras(23, modelos[-1], modelos[2], modelos[3]).to_csv(ruta, index=False)
+    return ruta
+
+
+def test_reanudar_con_otro_tam_bloque_tras_un_corte_no_duplica(almacenamiento_local, archivo):
+    llamadas = []
+
+    def insertar_y_cortar(registros, tam_lote):
+        llamadas.append(len(registros))
+        if len(llamadas) == 3:
+            # Se cae con la mitad del bloque ya insertada y sin guardar el progreso
+            insertar_lote(registros[:2], tam_lote)
+            raise ConnectionError("corte")
+        return insertar_lote(registros, tam_lote)
+
+    with pytest.raises(ConnectionError):
+        ingesta.ingerir(archivo, tam_bloque=5, insertar=insertar_y_cortar, salida=io.StringIO())
+    assert len(almacenamiento_local.seleccionar(["id"])) == 12
+
+    totales = ingesta.ingerir(archivo, tam_bloque=7, salida=io.StringIO())
+    assert totales["filas"] == 13
+    assert totales["insertadas"] == 11
+    claves = [f["clave_idempotencia"] for f in almacenamiento_local.seleccionar(["clave_idempotencia"])]
+    assert len(claves) == len(set(claves)) == 23
@@ -0,0 +1,33 @@
+import threading
+
+import pytest
+
+from backend import metricas
+
+
+@pytest.fixture
+def sin_medicion_global(monkeypatch):
+    monkeypatch.setattr(metricas, "HABILITADO", False)
+    monkeypatch.setattr(metricas, "_histogramas", {})
+
+
+def test_captura_de_un_hilo_no_activa_la_medicion_global(sin_medicion_global):
+    desgloses = {}
+
+    def sesion(nombre, capturar):
+        metricas.iniciar_peticion(capturar=capturar)
+        with metricas.medir("etapa"):
+            pass
+        desgloses[nombre] = metricas.ultima_peticion()
+
+    hilos = [threading.Thread(target=sesion, args=("panel", True)),
+             threading.Thread(target=sesion, args=("otra", False))]
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join()
+
+    assert list(desgloses["panel"]) == ["etapa"]
+    assert desgloses["otra"] == {}
+    assert not metricas.HABILITADO
+    assert metricas._histogramas == {}
@@ -0,0 +1,60 @@
+import pytest
+
+from backend import almacenamiento
+from backend.database import iterar_paginas, obtener_pagina
+
+
+class AlmacenamientoConTope(almacenamiento.AlmacenamientoSQLite):
+    """Como PostgREST: cada consulta devuelve como mucho `tope` filas, pida lo que pida."""
+
+    def __init__(self, ruta, tope, max_filas=None):
+        super().__init__(ruta)
+        self.tope = tope
+        self.max_filas = max_filas
+
+    def seleccionar(self, *args, **kwargs):
+        return super().seleccionar(*args, **kwargs)[:self.tope]
+
+
+@pytest.fixture
+def registros(almacenamiento_local):
+    filas = [{"latitud": -12.0, "longitud": -77.0 - i / 100, "clave_idempotencia": f"r{i}"} for i in range(4)]
+    return almacenamiento_local.insertar_lote_idempotente(filas)
+
+
+def test_ultima_pagina_llena_no_tiene_siguiente(registros):
+    pagina, siguiente = obtener_pagina(2)
+    assert list(pagina["id"]) == [r["id"] for r in registros[:2]]
+    assert siguiente == registros[1]["id"]
+
+    pagina, siguiente = obtener_pagina(2, siguiente)
+    assert list(pagina["id"]) == [r["id"] for r in registros[2:]]
+    assert siguiente is None
+
+
+def test_iterar_paginas_recorre_todas_las_filas(registros):
+    assert [len(p) for p in iterar_paginas(2)] == [2, 2]
+
+
+@pytest.mark.parametrize("max_filas", [3, None])
+def test_tope_del_backend_no_corta_el_recorrido(tmp_path, monkeypatch, max_filas):
+    # Con el tope declarado y también cuando el backend recorta sin avisar
+    con_tope = AlmacenamientoConTope(str(tmp_path / "registros_pp.sqlite"), tope=3, max_filas=max_filas)
+    monkeypatch.setattr(almacenamiento, "_almacenamiento", con_tope)
+    con_tope.insertar_lote_idempotente([{"latitud": -12.0, "clave_idempotencia": f"r{i}"} for i in range(8)])
+
+    assert sum(len(p) for p in iterar_paginas(2001)) == 8
+
+
+def test_pagina_se_acorta_al_tope_declarado(tmp_path, monkeypatch):
+    con_tope = AlmacenamientoConTope(str(tmp_path / "registros_pp.sqlite"), tope=3, max_filas=3)
+    monkeypatch.setattr(almacenamiento, "_almacenamiento", con_tope)
+    con_tope.insertar_lote_idempotente([{"latitud": -12.0, "clave_idempotencia": f"r{i}"} for i in range(5)])
+
+    vistas, siguiente = [], None
+    while True:
+        pagina, siguiente = obtener_pagina(50, siguiente)
+        vistas += list(pagina["id"])
+        if siguiente is None:
+            break
+    assert len(vistas) == len(set(vistas)) == 5
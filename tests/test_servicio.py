@@ -0,0 +1,26 @@
+import pytest
+
+from backend.loaders import load_all_models
+from backend.servicio import PlanificadorLotes, ServicioPrediccion
+from benchmarks.sinteticos import generar_muestras
+
+
+@pytest.fixture
+def servicio():
+    planificador = PlanificadorLotes(max_lote=16, espera_max=0.001)
+    yield ServicioPrediccion(planificador)
+    planificador.detener()
+
+
+def test_valores_no_numericos_invalidan_solo_su_fila(servicio):
+    modelos = load_all_models()
+    muestras = generar_muestras(4, modelos[-1], modelos[2], modelos[3]).to_dict("records")
+    numerica = next(c for c, v in muestras[0].items() if isinstance(v, float))
+    categorica = next(c for c, v in muestras[0].items() if isinstance(v, str))
+    muestras[1][numerica] = "doce"
+    muestras[2][categorica] = ["no", "hashable"]
+
+    respuestas = servicio.predecir(muestras)
+
+    assert respuestas[1] == respuestas[2] == {"error": "valores vacíos, no numéricos o no finitos"}
+    assert "fertilidad" in respuestas[0] and "fertilidad" in respuestas[3]